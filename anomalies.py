@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+import os
+import threading
+import time
+
+import db
+
+# Rows changed within this many seconds of a scan are examined again next time,
+# so writes still in flight when the watermark was taken are not skipped.
+WATERMARK_LAG_SECONDS = int(os.getenv("ANOMALY_WATERMARK_LAG_SECONDS", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS anomaly_scan_state (
+    scan_name VARCHAR(50) PRIMARY KEY,
+    watermark TIMESTAMP,
+    last_run_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Each rule is one set-based query; %(since)s is the rule's previous watermark.
+# Rules that wait for a day to end also re-examine rows dated on or after the
+# previous scan's day, so a row that was still too recent then is not skipped
+# once the watermark has moved past its updated_at.
+RULES = {
+    "missing_clock_out": """
+    SELECT a.id, a.employee_id, a.record_date
+    FROM attendance_records a
+    WHERE a.clock_in_time IS NOT NULL AND a.clock_out_time IS NULL
+      AND a.record_date < CURRENT_DATE
+      AND (a.updated_at > %(since)s OR a.record_date >= %(since)s::date)
+    """,
+    "clock_in_without_shift": """
+    SELECT a.id, a.employee_id, a.record_date
+    FROM attendance_records a
+    WHERE a.clock_in_time IS NOT NULL
+      AND a.updated_at > %(since)s
+      AND NOT EXISTS (
+          SELECT 1 FROM schedules s
+          WHERE s.employee_id = a.employee_id
+            AND a.record_date BETWEEN s.start_date AND s.end_date
+      )
+    """,
+    "absence_on_approved_leave": """
+    SELECT a.id, a.employee_id, a.record_date, l.id AS leave_id
+    FROM attendance_records a
+    JOIN leaves l ON l.employee_id = a.employee_id
+     AND a.record_date BETWEEN l.start_date AND l.end_date
+    WHERE a.status = 'Absent' AND l.status = 'Approved'
+      AND (a.updated_at > %(since)s OR l.updated_at > %(since)s)
+    """,
+    "overtime_without_attendance": """
+    SELECT o.id, o.employee_id, o.overtime_date AS record_date
+    FROM overtimes o
+    WHERE o.status <> 'Rejected'
+      AND o.overtime_date < CURRENT_DATE
+      AND (o.updated_at > %(since)s OR o.overtime_date >= %(since)s::date)
+      AND NOT EXISTS (
+          SELECT 1 FROM attendance_records a
+          WHERE a.employee_id = o.employee_id
+            AND a.record_date = o.overtime_date
+            AND a.clock_in_time IS NOT NULL
+      )
+    """,
+}
+
+# How long a missing state table is remembered before checking again for the migration
+RECHECK_SECONDS = 60
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+_checked_at = None
+
+
+def create_schema():
+    """Create the scan state table; run once by an administrator (python anomalies.py)"""
+    db.execute_query(SCHEMA)
+
+
+def state_ready():
+    """Return whether the scan state table exists; the server does not create it itself"""
+    global _schema_ready, _checked_at
+    if _schema_ready:
+        return True
+    with _schema_lock:
+        if _schema_ready or (_checked_at and time.monotonic() - _checked_at < RECHECK_SECONDS):
+            return _schema_ready
+        row = db.execute_query(
+            "SELECT to_regclass('anomaly_scan_state') IS NOT NULL AS ready", fetch_one=True
+        )
+        _schema_ready = bool(row and row["ready"])
+        _checked_at = time.monotonic()
+        return _schema_ready
+
+
+def scan(rules=None, full_rescan=False, limit=100):
+    """
+    Run the anomaly rules over rows changed since each rule's last scan.
+
+    Every rule keeps its own watermark row, locked for the duration of the
+    scan, so concurrent scans of the same rule run one after the other.
+    """
+    if not state_ready():
+        raise ValueError("Anomaly scan state is not set up; run 'python anomalies.py' to create it")
+    selected = list(rules or RULES)
+    unknown = [r for r in selected if r not in RULES]
+    if unknown:
+        raise ValueError(f"Unknown anomaly rules: {', '.join(unknown)}")
+
+    with db.transaction() as cursor:
+        cursor.execute("""
+        INSERT INTO anomaly_scan_state (scan_name)
+        SELECT unnest(%s::varchar[])
+        ON CONFLICT (scan_name) DO NOTHING
+        """, [selected])
+        cursor.execute("""
+        SELECT scan_name, watermark
+        FROM anomaly_scan_state
+        WHERE scan_name = ANY(%s)
+        ORDER BY scan_name
+        FOR UPDATE
+        """, [selected])
+        state = {row["scan_name"]: row for row in cursor.fetchall()}
+
+        findings = {}
+        for rule in selected:
+            since = None if full_rescan else state[rule]["watermark"]
+            cursor.execute(RULES[rule] + " ORDER BY record_date, employee_id",
+                           {"since": since or "-infinity"})
+            rows = cursor.fetchall()
+            findings[rule] = {
+                "since": since,
+                "count": len(rows),
+                "items": [dict(r) for r in rows[:limit]],
+            }
+
+        cursor.execute("""
+        UPDATE anomaly_scan_state
+        SET watermark = GREATEST(watermark, CURRENT_TIMESTAMP - make_interval(secs => %s)),
+            last_run_at = CURRENT_TIMESTAMP
+        WHERE scan_name = ANY(%s)
+        """, [WATERMARK_LAG_SECONDS, selected])
+
+    return findings
+
+
+if __name__ == "__main__":
+    create_schema()
+    print("Anomaly scan state table is ready")
@@ -1,10 +1,22 @@
+from contextlib import nullcontext
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 import json
 import functools
+import re
 
 from mcp.server.fastmcp import FastMCP, Context
+from pydantic import ValidationError
 import db
+import query_compiler
+import work_calendar
+import leave_balance
+import anomalies
+import roster
+import clock_journal
+import snapshot
+import response_budget
+import resource_versions
 
 # Decorator to handle database errors
 def handle_db_errors(func):
@@ -18,8 +30,134 @@ def handle_db_errors(func):
             return f"Error executing {func.__name__}: {error_message}"
     return wrapper
 
+class DeferredFastMCP(FastMCP):
+    """
+    FastMCP server that builds tool schemas on the first tools request.
+
+    Generating the pydantic argument models for every tool is the largest part
+    of importing this module, and the client's initialize handshake does not
+    need them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._pending_tools = []
+        super().__init__(*args, **kwargs)
+
+    def tool(self, *args, **kwargs):
+        def decorator(fn):
+            self._pending_tools.append((fn, args, kwargs))
+            return fn
+        return decorator
+
+    def register_pending_tools(self):
+        """Register every tool declared so far"""
+        while self._pending_tools:
+            fn, args, kwargs = self._pending_tools.pop(0)
+            self.add_tool(fn, *args, **kwargs)
+
+    async def list_tools(self):
+        self.register_pending_tools()
+        return await super().list_tools()
+
+    async def call_tool(self, name, arguments):
+        self.register_pending_tools()
+        return await super().call_tool(name, arguments)
+
+class Created(str):
+    """Message of a write tool that also carries the ID of the record it created or updated"""
+
+    def __new__(cls, message, record_id):
+        created = super().__new__(cls, message)
+        created.record_id = record_id
+        return created
+
 # Create an MCP server
-mcp = FastMCP("AttendanceSystem")
+mcp = DeferredFastMCP("AttendanceSystem")
+
+# Wake the database in the background so the first tool call does not pay for it
+db.start_background()
+
+# Start merging queued clock events when write-behind mode is enabled
+if clock_journal.journal:
+    clock_journal.journal.start()
+
+# Hot fixed-shape statements, prepared once per pooled connection
+db.register_statement("employee_by_id", """
+SELECT * FROM employee_department_view
+WHERE employee_id = %s
+""")
+db.register_statement("attendance_record_id", """
+SELECT id FROM attendance_records
+WHERE employee_id = %s AND record_date = %s
+""")
+db.register_statement("decide_leave", """
+UPDATE leaves l
+SET status = %s, approved_by = %s, updated_at = CURRENT_TIMESTAMP
+FROM (SELECT id, status FROM leaves WHERE id = %s FOR UPDATE) old
+WHERE l.id = old.id
+RETURNING l.id, l.employee_id, l.leave_type, l.start_date, l.duration,
+          old.status AS previous_status
+""")
+db.register_statement("decide_overtime", """
+UPDATE overtimes
+SET status = %s, approved_by = %s, updated_at = CURRENT_TIMESTAMP
+WHERE id = %s
+RETURNING id
+""")
+
+# Resource versions: the xmin of every row a resource is built from, so any
+# committed change to one of them, by this server or anyone else, changes it
+EMPLOYEE_VERSION = "e.xmin::text || '.' || COALESCE(d.xmin::text, '')"
+# Membership changes come from the counter bumped by a trigger on employees
+# (python resource_versions.py); without it the members are counted instead
+DEPARTMENT_VERSION = """d.xmin::text || '.' || COALESCE(p.xmin::text, '') || '.m' ||
+    COALESCE(m.version, 0)"""
+DEPARTMENT_VERSION_COUNTED = """d.xmin::text || '.' || COALESCE(p.xmin::text, '') || '.' ||
+    (SELECT COUNT(*) FROM employees c WHERE c.department_id = d.id)"""
+DEPARTMENT_MEMBERS = "LEFT JOIN department_member_versions m ON m.department_id = d.id"
+ATTENDANCE_VERSION = "a.xmin::text || '.' || " + EMPLOYEE_VERSION
+
+db.register_statement("employee_version", f"""
+SELECT {EMPLOYEE_VERSION} AS version
+FROM employees e LEFT JOIN departments d ON d.id = e.department_id
+WHERE e.id = %s
+""")
+db.register_statement("employee_resource", f"""
+SELECT v.*, {EMPLOYEE_VERSION} AS version
+FROM employee_department_view v
+JOIN employees e ON e.id = v.employee_id
+LEFT JOIN departments d ON d.id = e.department_id
+WHERE v.employee_id = %s
+""")
+for suffix, version, members in (("", DEPARTMENT_VERSION, DEPARTMENT_MEMBERS),
+                                 ("_counted", DEPARTMENT_VERSION_COUNTED, "")):
+    db.register_statement(f"department_version{suffix}", f"""
+    SELECT {version} AS version
+    FROM departments d LEFT JOIN departments p ON p.id = d.parent_id {members}
+    WHERE d.id = %s
+    """)
+    db.register_statement(f"department_resource{suffix}", f"""
+    SELECT d.*, p.dept_name AS parent_name,
+           (SELECT COUNT(*) FROM employees e WHERE e.department_id = d.id) AS employee_count,
+           {version} AS version
+    FROM departments d LEFT JOIN departments p ON p.id = d.parent_id {members}
+    WHERE d.id = %s
+    """)
+db.register_statement("attendance_version", f"""
+SELECT {ATTENDANCE_VERSION} AS version
+FROM attendance_records a
+JOIN employees e ON e.id = a.employee_id
+LEFT JOIN departments d ON d.id = e.department_id
+WHERE a.employee_id = %s AND a.record_date = %s
+""")
+db.register_statement("attendance_resource", f"""
+SELECT v.*, {ATTENDANCE_VERSION} AS version
+FROM attendance_detail_view v
+JOIN attendance_records a ON a.employee_id = v.employee_id AND a.record_date = v.record_date
+JOIN employees e ON e.id = a.employee_id
+LEFT JOIN departments d ON d.id = e.department_id
+WHERE a.employee_id = %s AND a.record_date = %s
+""")
 
 # ==================== Employee Information Tools ====================
 
@@ -38,63 +176,87 @@ def get_employee_info(employee_id: int = None, employee_number: str = None) -> s
     if not employee_id and not employee_number:
         return "Error: Either employee_id or employee_number must be provided"
 
-    query = """
-    SELECT * FROM employee_department_view
-    WHERE 1=1
-    """
-    params = []
+    if employee_id and not employee_number:
+        result = db.execute_prepared("employee_by_id", [employee_id], fetch_one=True)
+    else:
+        query, params = query_compiler.EMPLOYEES.compile(
+            employee_id=employee_id, employee_number=employee_number
+        )
+        result = db.execute_query(query, params, fetch_one=True)
 
-    if employee_id:
-        query += " AND employee_id = %s"
-        params.append(employee_id)
+    if not result:
+        return f"No employee found with the provided information"
 
-    if employee_number:
-        query += " AND employee_number = %s"
-        params.append(employee_number)
+    return json.dumps(dict(result), indent=2, default=str)
 
-    result = db.execute_query(query, params, fetch_one=True)
+@mcp.tool()
+def list_employees(
+    department_id: Optional[Union[int, List[int]]] = None,
+    status: Optional[Union[str, List[str]]] = None,
+    name_prefix: Optional[str] = None,
+    max_response_bytes: Optional[int] = None,
+    continuation: Optional[str] = None
+) -> str:
+    """
+    List employees with optional filtering by department, status and name.
+
+    Args:
+        department_id: Filter by department ID, or a list of IDs (optional)
+        status: Filter by employee status (e.g., 'Active', 'Inactive'), or a list of statuses (optional)
+        name_prefix: Filter by the beginning of the employee name (optional)
+        max_response_bytes: Largest response to return before summarising, in bytes (optional, default from MAX_RESPONSE_BYTES)
+        continuation: Token from a previous summarised response, to fetch the next page (optional)
+
+    Returns:
+        A page of employees with offset, summary and continuation token in a formatted string
+    """
+    try:
+        result = response_budget.fetch(
+            query_compiler.EMPLOYEE_LIST, max_response_bytes, continuation,
+            department_id=department_id, status=status, name_prefix=name_prefix
+        )
+    except ValueError as e:
+        return f"Error: {e}"
 
     if not result:
-        return f"No employee found with the provided information"
+        return "No employees found with the specified criteria"
 
-    return json.dumps(dict(result), indent=2, default=str)
+    return result
 
 @mcp.tool()
-def list_employees(department_id: Optional[int] = None, status: Optional[str] = None) -> str:
+def search_employees(
+    query: str,
+    limit: int = 10,
+    department_id: Optional[int] = None,
+    status: Optional[str] = None
+) -> str:
     """
-    List employees with optional filtering by department and status.
+    Find employees by name or employee number, tolerating typos and partial input.
 
     Args:
+        query: Part of a name or employee number (e.g., 'Zhang', 'E001')
+        limit: Maximum number of matches to return (default: 10)
         department_id: Filter by department ID (optional)
         status: Filter by employee status (e.g., 'Active', 'Inactive') (optional)
 
     Returns:
-        List of employees in a formatted string
+        Best matches first, with a score from 0 to 1, in a formatted string
     """
-    query = """
-    SELECT employee_id, employee_number, employee_name, position,
-           dept_name, hire_date, employee_status
-    FROM employee_department_view
-    WHERE 1=1
-    """
-    params = []
-
-    if department_id:
-        query += " AND department_id = %s"
-        params.append(department_id)
+    if not query or not query.strip():
+        return "Error: query must not be empty"
 
-    if status:
-        query += " AND employee_status = %s"
-        params.append(status)
+    if limit <= 0:
+        return "Error: limit must be greater than 0"
 
-    query += " ORDER BY dept_name, employee_name"
+    # Imported here so NumPy is not loaded at server startup
+    import employee_search
 
-    results = db.execute_query(query, params)
+    results = employee_search.search(query.strip(), limit, department_id, status)
 
     if not results:
-        return "No employees found with the specified criteria"
+        return f"No employees found matching '{query}'"
 
-    return json.dumps([dict(r) for r in results], indent=2, default=str)
+    return json.dumps(results, indent=2, default=str)
 
 @mcp.tool()
 def list_departments() -> str:
@@ -122,59 +284,42 @@ def list_departments() -> str:
 
 @mcp.tool()
 def get_attendance_records(
-    employee_id: Optional[int] = None,
-    employee_number: Optional[str] = None,
+    employee_id: Optional[Union[int, List[int]]] = None,
+    employee_number: Optional[Union[str, List[str]]] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    status: Optional[str] = None
+    status: Optional[Union[str, List[str]]] = None,
+    max_response_bytes: Optional[int] = None,
+    continuation: Optional[str] = None
 ) -> str:
     """
     Get attendance records with optional filtering.
 
     Args:
-        employee_id: Filter by employee ID (optional)
-        employee_number: Filter by employee number (optional)
+        employee_id: Filter by employee ID, or a list of IDs (optional)
+        employee_number: Filter by employee number, or a list of numbers (optional)
         start_date: Start date in YYYY-MM-DD format (optional)
         end_date: End date in YYYY-MM-DD format (optional)
-        status: Filter by attendance status (e.g., 'Normal', 'Late', 'Absent') (optional)
+        status: Filter by attendance status (e.g., 'Normal', 'Late', 'Absent'), or a list of statuses (optional)
+        max_response_bytes: Largest response to return before summarising, in bytes (optional, default from MAX_RESPONSE_BYTES)
+        continuation: Token from a previous summarised response, to fetch the next page (optional)
 
     Returns:
-        Attendance records in a formatted string
+        A page of attendance records with offset, summary and continuation token in a formatted string
     """
-    query = """
-    SELECT * FROM attendance_detail_view
-    WHERE 1=1
-    """
-    params = []
-
-    if employee_id:
-        query += " AND employee_id = %s"
-        params.append(employee_id)
-
-    if employee_number:
-        query += " AND employee_number = %s"
-        params.append(employee_number)
-
-    if start_date:
-        query += " AND record_date >= %s"
-        params.append(start_date)
-
-    if end_date:
-        query += " AND record_date <= %s"
-        params.append(end_date)
-
-    if status:
-        query += " AND attendance_status = %s"
-        params.append(status)
-
-    query += " ORDER BY record_date DESC, employee_name"
+    try:
+        result = response_budget.fetch(
+            query_compiler.ATTENDANCE, max_response_bytes, continuation,
+            employee_id=employee_id, employee_number=employee_number,
+            start_date=start_date, end_date=end_date, status=status
+        )
+    except ValueError as e:
+        return f"Error: {e}"
 
-    results = db.execute_query(query, params)
-
-    if not results:
+    if not result:
         return "No attendance records found with the specified criteria"
 
-    return json.dumps([dict(r) for r in results], indent=2, default=str)
+    return result
 
 @mcp.tool()
 def submit_attendance_record(
@@ -183,7 +328,8 @@ def submit_attendance_record(
     clock_in_time: Optional[str] = None,
     clock_out_time: Optional[str] = None,
     status: str = "Normal",
-    remark: Optional[str] = None
+    remark: Optional[str] = None,
+    idempotency_key: Optional[str] = None
 ) -> str:
     """
     Submit a new attendance record or update an existing one.
@@ -195,16 +341,25 @@ def submit_attendance_record(
         clock_out_time: Clock-out time in YYYY-MM-DD HH:MM:SS format (optional)
         status: Attendance status (default: 'Normal')
         remark: Additional remarks (optional)
+        idempotency_key: Client key so a retried submission is applied once, in write-behind mode (optional)
 
     Returns:
         Result message
     """
+    # Batches write directly so the record is part of the batch transaction
+    if clock_journal.journal and not db.in_batch():
+        try:
+            key = clock_journal.journal.append(
+                employee_id, record_date, clock_in_time, clock_out_time, status, remark, idempotency_key
+            )
+        except ValueError as e:
+            return f"Error: {e}"
+        return f"Attendance record queued successfully with key: {key}"
+
     # Check if record already exists
-    check_query = """
-    SELECT id FROM attendance_records
-    WHERE employee_id = %s AND record_date = %s
-    """
-    existing_record = db.execute_query(check_query, [employee_id, record_date], fetch_one=True)
+    existing_record = db.execute_prepared(
+        "attendance_record_id", [employee_id, record_date], fetch_one=True
+    )
 
     if existing_record:
         # Update existing record
@@ -221,7 +376,7 @@ def submit_attendance_record(
         """
         params = [clock_in_time, clock_out_time, status, remark, employee_id, record_date]
         result = db.execute_query(query, params, fetch_one=True)
-        return f"Attendance record updated successfully with ID: {result['id']}"
+        return Created(f"Attendance record updated successfully with ID: {result['id']}", result["id"])
     else:
         # Insert new record
         query = """
@@ -232,71 +387,50 @@ def submit_attendance_record(
         """
         params = [employee_id, record_date, clock_in_time, clock_out_time, status, remark]
         result = db.execute_query(query, params, fetch_one=True)
-        return f"Attendance record created successfully with ID: {result['id']}"
+        return Created(f"Attendance record created successfully with ID: {result['id']}", result["id"])
 
 # ==================== Leave Management Tools ====================
 
 @mcp.tool()
 def get_leave_requests(
-    employee_id: Optional[int] = None,
-    employee_number: Optional[str] = None,
+    employee_id: Optional[Union[int, List[int]]] = None,
+    employee_number: Optional[Union[str, List[str]]] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    status: Optional[str] = None,
-    leave_type: Optional[str] = None
+    status: Optional[Union[str, List[str]]] = None,
+    leave_type: Optional[Union[str, List[str]]] = None,
+    max_response_bytes: Optional[int] = None,
+    continuation: Optional[str] = None
 ) -> str:
     """
     Get leave requests with optional filtering.
 
     Args:
-        employee_id: Filter by employee ID (optional)
-        employee_number: Filter by employee number (optional)
+        employee_id: Filter by employee ID, or a list of IDs (optional)
+        employee_number: Filter by employee number, or a list of numbers (optional)
         start_date: Filter by leave start date in YYYY-MM-DD format (optional)
         end_date: Filter by leave end date in YYYY-MM-DD format (optional)
-        status: Filter by leave status (e.g., 'Pending', 'Approved', 'Rejected') (optional)
-        leave_type: Filter by leave type (e.g., 'Annual', 'Sick', 'Personal') (optional)
+        status: Filter by leave status (e.g., 'Pending', 'Approved', 'Rejected'), or a list of statuses (optional)
+        leave_type: Filter by leave type (e.g., 'Annual', 'Sick', 'Personal'), or a list of types (optional)
+        max_response_bytes: Largest response to return before summarising, in bytes (optional, default from MAX_RESPONSE_BYTES)
+        continuation: Token from a previous summarised response, to fetch the next page (optional)
 
     Returns:
-        Leave requests in a formatted string
-    """
-    query = """
-    SELECT * FROM leave_detail_view
-    WHERE 1=1
+        A page of leave requests with offset, summary and continuation token in a formatted string
     """
-    params = []
-
-    if employee_id:
-        query += " AND employee_id = %s"
-        params.append(employee_id)
+    try:
+        result = response_budget.fetch(
+            query_compiler.LEAVES, max_response_bytes, continuation,
+            employee_id=employee_id, employee_number=employee_number,
+            start_date=start_date, end_date=end_date, status=status, leave_type=leave_type
+        )
+    except ValueError as e:
+        return f"Error: {e}"
 
-    if employee_number:
-        query += " AND employee_number = %s"
-        params.append(employee_number)
-
-    if start_date:
-        query += " AND start_date >= %s"
-        params.append(start_date)
-
-    if end_date:
-        query += " AND end_date <= %s"
-        params.append(end_date)
-
-    if status:
-        query += " AND leave_status = %s"
-        params.append(status)
-
-    if leave_type:
-        query += " AND leave_type = %s"
-        params.append(leave_type)
-
-    query += " ORDER BY start_date DESC, employee_name"
-
-    results = db.execute_query(query, params)
-
-    if not results:
+    if not result:
         return "No leave requests found with the specified criteria"
 
-    return json.dumps([dict(r) for r in results], indent=2, default=str)
+    return result
 
 @mcp.tool()
 def submit_leave_request(
@@ -305,7 +439,8 @@ def submit_leave_request(
     start_date: str,
     end_date: str,
     reason: str,
-    duration: Optional[float] = None
+    duration: Optional[float] = None,
+    check_balance: bool = False
 ) -> str:
     """
     Submit a new leave request.
@@ -316,16 +451,29 @@ def submit_leave_request(
         start_date: Start date in YYYY-MM-DD format
         end_date: End date in YYYY-MM-DD format
         reason: Reason for the leave
-        duration: Duration in days (optional, will be calculated if not provided)
+        duration: Duration in days (optional, calculated as working days if not provided)
+        check_balance: Reject the request if it exceeds the remaining leave balance (default: False)
 
     Returns:
         Result message
     """
-    # Calculate duration if not provided
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    if end < start:
+        return f"Error: End date {end_date} is before start date {start_date}"
+
+    # Calculate duration if not provided, skipping weekly rest days and holidays
     if not duration:
-        start = datetime.strptime(start_date, "%Y-%m-%d").date()
-        end = datetime.strptime(end_date, "%Y-%m-%d").date()
-        duration = (end - start).days + 1
+        duration = work_calendar.working_days_between(start_date, end_date)
+        if duration == 0:
+            return (f"Error: No working days between {start_date} and {end_date}; "
+                    f"the range only covers rest days or holidays")
+
+    ledger = leave_balance.ledger_enabled()
+    if check_balance and not ledger:
+        return "Error: Leave balances are not set up; run 'python leave_balance.py' to create the ledger"
+    # A range crossing New Year draws on each year's balance for its own part
+    parts = leave_balance.split_by_year(start, end, duration)
 
     query = """
     INSERT INTO leaves
@@ -334,9 +482,21 @@ def submit_leave_request(
     RETURNING id
     """
     params = [employee_id, leave_type, start_date, end_date, duration, reason]
-    result = db.execute_query(query, params, fetch_one=True)
 
-    return f"Leave request submitted successfully with ID: {result['id']}"
+    with db.transaction() as cursor:
+        if check_balance:
+            for year, days in parts:
+                remaining = leave_balance.available(cursor, employee_id, leave_type, year)
+                if remaining < days:
+                    return (f"Error: Insufficient {leave_type} leave balance for {year}: "
+                            f"{remaining:g} days available, {days:g} requested")
+
+        cursor.execute(query, params)
+        result = cursor.fetchone()
+        if ledger:
+            leave_balance.submit(cursor, employee_id, leave_type, start, end, duration, result["id"])
+
+    return Created(f"Leave request submitted successfully with ID: {result['id']}", result["id"])
 
 @mcp.tool()
 def approve_leave_request(
@@ -358,77 +518,126 @@ def approve_leave_request(
     if status not in ["Approved", "Rejected"]:
         return "Error: Status must be either 'Approved' or 'Rejected'"
 
-    query = """
-    UPDATE leaves
-    SET status = %s, approved_by = %s, updated_at = CURRENT_TIMESTAMP
-    WHERE id = %s
-    RETURNING id
-    """
-    params = [status, approved_by, leave_id]
-    result = db.execute_query(query, params, fetch_one=True)
+    ledger = leave_balance.ledger_enabled()
+
+    with db.transaction() as cursor:
+        db.run_prepared(cursor, "decide_leave", [status, approved_by, leave_id])
+        result = cursor.fetchone()
+        if result and ledger:
+            leave_balance.apply_status_change(cursor, result, result["previous_status"], status)
 
     if not result:
         return f"Error: Leave request with ID {leave_id} not found"
 
     return f"Leave request {status.lower()} successfully"
 
-# ==================== Overtime Management Tools ====================
-
 @mcp.tool()
-def get_overtime_requests(
+def get_leave_balance(
     employee_id: Optional[int] = None,
-    employee_number: Optional[str] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    status: Optional[str] = None
+    employee_ids: Optional[List[int]] = None,
+    department_id: Optional[int] = None,
+    year: Optional[int] = None,
+    leave_type: Optional[str] = None
 ) -> str:
     """
-    Get overtime requests with optional filtering.
+    Get remaining leave balances for one employee, a list of employees or a department.
 
     Args:
-        employee_id: Filter by employee ID (optional)
-        employee_number: Filter by employee number (optional)
-        start_date: Filter by overtime date in YYYY-MM-DD format (optional)
-        end_date: Filter by overtime date in YYYY-MM-DD format (optional)
-        status: Filter by overtime status (e.g., 'Pending', 'Approved', 'Rejected') (optional)
+        employee_id: The ID of the employee (optional)
+        employee_ids: IDs of several employees, e.g. a team (optional)
+        department_id: Get balances for every employee of a department (optional)
+        year: The leave year (default: current year)
+        leave_type: Filter by leave type (e.g., 'Annual', 'Sick', 'Personal') (optional)
 
     Returns:
-        Overtime requests in a formatted string
+        Entitled, pending, used and available days in a formatted string
     """
-    query = """
-    SELECT * FROM overtime_detail_view
-    WHERE 1=1
+    ids = list(employee_ids or [])
+    if employee_id:
+        ids.append(employee_id)
+
+    if not ids and not department_id:
+        return "Error: Either employee_id, employee_ids or department_id must be provided"
+
+    if not leave_balance.ledger_enabled():
+        return "Error: Leave balances are not set up; run 'python leave_balance.py' to create the ledger"
+    results = leave_balance.get_balances(ids, department_id, year or date.today().year, leave_type)
+
+    if not results:
+        return "No leave balances found with the specified criteria"
+
+    return json.dumps([dict(r) for r in results], indent=2, default=str)
+
+@mcp.tool()
+def grant_leave_entitlement(
+    employee_id: int,
+    leave_type: str,
+    year: int,
+    days: float,
+    remark: Optional[str] = None
+) -> str:
     """
-    params = []
+    Grant (or, with negative days, withdraw) leave entitlement for a year.
 
-    if employee_id:
-        query += " AND employee_id = %s"
-        params.append(employee_id)
+    Args:
+        employee_id: The ID of the employee
+        leave_type: Type of leave (e.g., 'Annual', 'Sick', 'Personal')
+        year: The leave year
+        days: Number of days to add to the entitlement
+        remark: Additional remarks (optional)
 
-    if employee_number:
-        query += " AND employee_number = %s"
-        params.append(employee_number)
+    Returns:
+        Result message
+    """
+    if not leave_balance.ledger_enabled():
+        return "Error: Leave balances are not set up; run 'python leave_balance.py' to create the ledger"
 
-    if start_date:
-        query += " AND overtime_date >= %s"
-        params.append(start_date)
+    with db.transaction() as cursor:
+        leave_balance.post(cursor, employee_id, leave_type, year, "entitled", days,
+                           "Entitlement", remark=remark)
 
-    if end_date:
-        query += " AND overtime_date <= %s"
-        params.append(end_date)
+    return f"Granted {days:g} days of {leave_type} leave for {year} to employee ID {employee_id}"
 
-    if status:
-        query += " AND overtime_status = %s"
-        params.append(status)
+# ==================== Overtime Management Tools ====================
 
-    query += " ORDER BY overtime_date DESC, employee_name"
+@mcp.tool()
+def get_overtime_requests(
+    employee_id: Optional[Union[int, List[int]]] = None,
+    employee_number: Optional[Union[str, List[str]]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[Union[str, List[str]]] = None,
+    max_response_bytes: Optional[int] = None,
+    continuation: Optional[str] = None
+) -> str:
+    """
+    Get overtime requests with optional filtering.
 
-    results = db.execute_query(query, params)
+    Args:
+        employee_id: Filter by employee ID, or a list of IDs (optional)
+        employee_number: Filter by employee number, or a list of numbers (optional)
+        start_date: Filter by overtime date in YYYY-MM-DD format (optional)
+        end_date: Filter by overtime date in YYYY-MM-DD format (optional)
+        status: Filter by overtime status (e.g., 'Pending', 'Approved', 'Rejected'), or a list of statuses (optional)
+        max_response_bytes: Largest response to return before summarising, in bytes (optional, default from MAX_RESPONSE_BYTES)
+        continuation: Token from a previous summarised response, to fetch the next page (optional)
 
-    if not results:
+    Returns:
+        A page of overtime requests with offset, summary and continuation token in a formatted string
+    """
+    try:
+        result = response_budget.fetch(
+            query_compiler.OVERTIMES, max_response_bytes, continuation,
+            employee_id=employee_id, employee_number=employee_number,
+            start_date=start_date, end_date=end_date, status=status
+        )
+    except ValueError as e:
+        return f"Error: {e}"
+
+    if not result:
         return "No overtime requests found with the specified criteria"
 
-    return json.dumps([dict(r) for r in results], indent=2, default=str)
+    return result
 
 @mcp.tool()
 def submit_overtime_request(
@@ -465,7 +674,7 @@ def submit_overtime_request(
     params = [employee_id, overtime_date, start_time, end_time, hours, reason]
     result = db.execute_query(query, params, fetch_one=True)
 
-    return f"Overtime request submitted successfully with ID: {result['id']}"
+    return Created(f"Overtime request submitted successfully with ID: {result['id']}", result["id"])
 
 @mcp.tool()
 def approve_overtime_request(
@@ -487,26 +696,175 @@ def approve_overtime_request(
     if status not in ["Approved", "Rejected"]:
         return "Error: Status must be either 'Approved' or 'Rejected'"
 
-    query = """
-    UPDATE overtimes
-    SET status = %s, approved_by = %s, updated_at = CURRENT_TIMESTAMP
-    WHERE id = %s
-    RETURNING id
-    """
-    params = [status, approved_by, overtime_id]
-    result = db.execute_query(query, params, fetch_one=True)
+    result = db.execute_prepared("decide_overtime", [status, approved_by, overtime_id], fetch_one=True)
 
     if not result:
         return f"Error: Overtime request with ID {overtime_id} not found"
 
     return f"Overtime request {status.lower()} successfully"
 
+# ==================== Bulk Approval Tools ====================
+
+def _bulk_decide_requests(
+    table: str,
+    date_column: str,
+    request_ids: Optional[List[int]],
+    approved_by: int,
+    status: str,
+    department_id: Optional[int],
+    employee_id: Optional[int],
+    before_date: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Decide many leave/overtime requests with a single UPDATE in one transaction.
+
+    Only rows that are still 'Pending' when the UPDATE runs are changed, so a
+    request decided concurrently by someone else is reported as already decided
+    instead of being overwritten.
+    """
+    if request_ids:
+        requested = "SELECT DISTINCT unnest(%s::int[]) AS id"
+        params = [list(request_ids)]
+    else:
+        requested = f"""
+        SELECT r.id FROM {table} r
+        JOIN employees e ON r.employee_id = e.id
+        WHERE r.status = 'Pending'
+        """
+        params = []
+
+        if department_id:
+            requested += " AND e.department_id = %s"
+            params.append(department_id)
+
+        if employee_id:
+            requested += " AND r.employee_id = %s"
+            params.append(employee_id)
+
+        if before_date:
+            requested += f" AND r.{date_column} < %s"
+            params.append(before_date)
+
+    query = f"""
+    WITH requested AS ({requested}),
+    updated AS (
+        UPDATE {table}
+        SET status = %s, approved_by = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ANY(ARRAY(SELECT id FROM requested)) AND status = 'Pending'
+        RETURNING id
+    )
+    SELECT q.id, (u.id IS NOT NULL) AS changed, t.id IS NOT NULL AS found, t.status
+    FROM requested q
+    LEFT JOIN updated u ON u.id = q.id
+    LEFT JOIN {table} t ON t.id = q.id
+    ORDER BY q.id
+    """
+    params += [status, approved_by]
+
+    ledger = table == "leaves" and leave_balance.ledger_enabled()
+
+    with db.transaction() as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        changed = [row["id"] for row in rows if row["changed"]]
+        if ledger and changed:
+            leave_balance.apply_bulk_decision(cursor, changed, status)
+
+    result = {"status": status, "updated": [], "missing": [], "already_decided": {}}
+    for row in rows:
+        if row["changed"]:
+            result["updated"].append(row["id"])
+        elif not row["found"]:
+            result["missing"].append(row["id"])
+        else:
+            result["already_decided"][str(row["id"])] = row["status"]
+
+    return result
+
+@mcp.tool()
+def bulk_approve_leave_requests(
+    approved_by: int,
+    status: str = "Approved",
+    leave_ids: Optional[List[int]] = None,
+    department_id: Optional[int] = None,
+    employee_id: Optional[int] = None,
+    before_date: Optional[str] = None
+) -> str:
+    """
+    Approve or reject many leave requests at once.
+
+    Either pass explicit leave_ids, or leave them out and select all pending
+    requests matching the filters.
+
+    Args:
+        approved_by: The ID of the approver
+        status: New status ('Approved' or 'Rejected')
+        leave_ids: IDs of the leave requests to decide (optional)
+        department_id: Decide pending requests of this department (optional)
+        employee_id: Decide pending requests of this employee (optional)
+        before_date: Decide pending requests starting before this date, YYYY-MM-DD (optional)
+
+    Returns:
+        The IDs that were updated, missing or already decided
+    """
+    if status not in ["Approved", "Rejected"]:
+        return "Error: Status must be either 'Approved' or 'Rejected'"
+
+    if not leave_ids and not (department_id or employee_id or before_date):
+        return "Error: Either leave_ids or at least one filter must be provided"
+
+    result = _bulk_decide_requests(
+        "leaves", "start_date", leave_ids, approved_by, status,
+        department_id, employee_id, before_date
+    )
+
+    return json.dumps(result, indent=2, default=str)
+
+@mcp.tool()
+def bulk_approve_overtime_requests(
+    approved_by: int,
+    status: str = "Approved",
+    overtime_ids: Optional[List[int]] = None,
+    department_id: Optional[int] = None,
+    employee_id: Optional[int] = None,
+    before_date: Optional[str] = None
+) -> str:
+    """
+    Approve or reject many overtime requests at once.
+
+    Either pass explicit overtime_ids, or leave them out and select all pending
+    requests matching the filters.
+
+    Args:
+        approved_by: The ID of the approver
+        status: New status ('Approved' or 'Rejected')
+        overtime_ids: IDs of the overtime requests to decide (optional)
+        department_id: Decide pending requests of this department (optional)
+        employee_id: Decide pending requests of this employee (optional)
+        before_date: Decide pending requests with an overtime date before this date, YYYY-MM-DD (optional)
+
+    Returns:
+        The IDs that were updated, missing or already decided
+    """
+    if status not in ["Approved", "Rejected"]:
+        return "Error: Status must be either 'Approved' or 'Rejected'"
+
+    if not overtime_ids and not (department_id or employee_id or before_date):
+        return "Error: Either overtime_ids or at least one filter must be provided"
+
+    result = _bulk_decide_requests(
+        "overtimes", "overtime_date", overtime_ids, approved_by, status,
+        department_id, employee_id, before_date
+    )
+
+    return json.dumps(result, indent=2, default=str)
+
 # ==================== Schedule Management Tools ====================
 
 @mcp.tool()
 def get_employee_schedule(
-    employee_id: Optional[int] = None,
-    employee_number: Optional[str] = None,
+    employee_id: Optional[Union[int, List[int]]] = None,
+    employee_number: Optional[Union[str, List[str]]] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ) -> str:
@@ -514,8 +872,8 @@ def get_employee_schedule(
     Get employee schedule with optional filtering.
 
     Args:
-        employee_id: Filter by employee ID (optional if employee_number is provided)
-        employee_number: Filter by employee number (optional if employee_id is provided)
+        employee_id: Filter by employee ID, or a list of IDs (optional if employee_number is provided)
+        employee_number: Filter by employee number, or a list of numbers (optional if employee_id is provided)
         start_date: Filter by schedule start date in YYYY-MM-DD format (optional)
         end_date: Filter by schedule end date in YYYY-MM-DD format (optional)
 
@@ -525,35 +883,10 @@ def get_employee_schedule(
     if not employee_id and not employee_number:
         return "Error: Either employee_id or employee_number must be provided"
 
-    query = """
-    SELECT s.id as schedule_id, e.id as employee_id, e.employee_number, e.name as employee_name,
-           s.start_date, s.end_date, sh.id as shift_id, sh.shift_name,
-           sh.start_time, sh.end_time, sh.is_night_shift
-    FROM schedules s
-    JOIN employees e ON s.employee_id = e.id
-    JOIN shifts sh ON s.shift_id = sh.id
-    WHERE 1=1
-    """
-    params = []
-
-    if employee_id:
-        query += " AND e.id = %s"
-        params.append(employee_id)
-
-    if employee_number:
-        query += " AND e.employee_number = %s"
-        params.append(employee_number)
-
-    if start_date:
-        query += " AND s.start_date >= %s"
-        params.append(start_date)
-
-    if end_date:
-        query += " AND s.end_date <= %s"
-        params.append(end_date)
-
-    query += " ORDER BY s.start_date, e.name"
-
+    query, params = query_compiler.SCHEDULES.compile(
+        employee_id=employee_id, employee_number=employee_number,
+        start_date=start_date, end_date=end_date
+    )
     results = db.execute_query(query, params)
 
     if not results:
@@ -625,8 +958,64 @@ def assign_schedule(
     """
     params = [employee_id, shift_id, start_date, end_date]
     result = db.execute_query(query, params, fetch_one=True)
+    roster.roster.add_schedule(result['id'])
 
-    return f"Schedule assigned successfully with ID: {result['id']}"
+    return Created(f"Schedule assigned successfully with ID: {result['id']}", result["id"])
+
+@mcp.tool()
+def get_roster(
+    start_date: str,
+    end_date: Optional[str] = None,
+    department_id: Optional[int] = None,
+    hourly: bool = False
+) -> str:
+    """
+    Get who is scheduled on each day of a date range, for a department or the whole company.
+
+    Args:
+        start_date: First day in YYYY-MM-DD format
+        end_date: Last day in YYYY-MM-DD format (optional, defaults to start_date)
+        department_id: Filter by department ID (optional)
+        hourly: Include the number of people on shift in each hour of each day (default: False)
+
+    Returns:
+        Scheduled employees per day in a formatted string
+    """
+    days = roster.roster_for_range(start_date, end_date, department_id, hourly)
+
+    return json.dumps(days, indent=2, default=str)
+
+@mcp.tool()
+def get_on_shift(
+    at: Optional[str] = None,
+    department_id: Optional[int] = None
+) -> str:
+    """
+    Get who is on shift at a point in time, including night shifts that started the day before.
+
+    Args:
+        at: Point in time in YYYY-MM-DD HH:MM:SS format (optional, defaults to now)
+        department_id: Filter by department ID (optional)
+
+    Returns:
+        Employees on shift in a formatted string
+    """
+    moment = datetime.strptime(at, "%Y-%m-%d %H:%M:%S") if at else datetime.now()
+    rows = roster.roster.on_shift_at(moment, department_id)
+
+    if not rows:
+        return f"No employees on shift at {moment}"
+
+    return json.dumps([{
+        "employee_id": r["employee_id"],
+        "employee_number": r["employee_number"],
+        "employee_name": r["employee_name"],
+        "department_id": r["department_id"],
+        "shift_name": r["shift_name"],
+        "start_time": r["start_time"],
+        "end_time": r["end_time"],
+        "is_night_shift": r["is_night_shift"],
+    } for r in rows], indent=2, default=str)
 
 # ==================== Statistics and Reports ====================
 
@@ -634,8 +1023,8 @@ def assign_schedule(
 def get_monthly_attendance_stats(
     year: int,
     month: int,
-    department_id: Optional[int] = None,
-    employee_id: Optional[int] = None
+    department_id: Optional[Union[int, List[int]]] = None,
+    employee_id: Optional[Union[int, List[int]]] = None
 ) -> str:
     """
     Get monthly attendance statistics.
@@ -643,39 +1032,149 @@ def get_monthly_attendance_stats(
     Args:
         year: The year
         month: The month (1-12)
-        department_id: Filter by department ID (optional)
-        employee_id: Filter by employee ID (optional)
+        department_id: Filter by department ID, or a list of IDs (optional)
+        employee_id: Filter by employee ID, or a list of IDs (optional)
 
     Returns:
-        Monthly attendance statistics in a formatted string
+        Monthly attendance statistics, including the month's working days, in a formatted string
     """
-    query = """
-    SELECT * FROM monthly_attendance_stats
-    WHERE year = %s AND month = %s
+    query, params = query_compiler.MONTHLY_STATS.compile(
+        year=year, month=month, department_id=department_id, employee_id=employee_id
+    )
+    results = db.execute_query(query, params)
+
+    if not results:
+        return "No attendance statistics found for the specified criteria"
+
+    working_days = work_calendar.working_days_in_month(year, month)
+    return json.dumps([dict(r, working_days=working_days) for r in results], indent=2, default=str)
+
+@mcp.tool()
+def compute_payroll_attendance(
+    year: int,
+    month: int,
+    department_id: Optional[int] = None,
+    output_path: Optional[str] = None
+) -> str:
     """
-    params = [year, month]
+    Compute month-end payroll attendance metrics for every employee and write them to a CSV file.
 
-    if department_id:
-        # Join with employees to filter by department
-        query = """
-        SELECT mas.* FROM monthly_attendance_stats mas
-        JOIN employees e ON mas.employee_id = e.id
-        WHERE mas.year = %s AND mas.month = %s AND e.department_id = %s
-        """
-        params = [year, month, department_id]
+    Metrics per employee: worked hours, late minutes, early-leave minutes,
+    approved overtime hours, and paid and unpaid leave days.
 
-    if employee_id:
-        query += " AND employee_id = %s"
-        params.append(employee_id)
+    Args:
+        year: The year
+        month: The month (1-12)
+        department_id: Only include employees of this department (optional)
+        output_path: Name of the .csv file to write in PAYROLL_OUTPUT_DIR, without directories (optional, defaults to payroll_YYYY_MM.csv)
 
-    query += " ORDER BY dept_name, employee_name"
+    Returns:
+        The CSV file path and workforce totals in a formatted string
+    """
+    if not 1 <= month <= 12:
+        return "Error: Month must be between 1 and 12"
 
-    results = db.execute_query(query, params)
+    # Imported here so NumPy is not loaded at server startup
+    import payroll
+
+    try:
+        summary = payroll.run(year, month, department_id, output_path)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    return json.dumps(summary, indent=2, default=str)
+
+@mcp.tool()
+def scan_attendance_anomalies(
+    rules: Optional[List[str]] = None,
+    full_rescan: bool = False,
+    limit: int = 100
+) -> str:
+    """
+    Scan for attendance anomalies in rows changed since the previous scan.
+
+    Rules: 'missing_clock_out', 'clock_in_without_shift',
+    'absence_on_approved_leave' and 'overtime_without_attendance'.
+
+    Args:
+        rules: Rules to run (optional, defaults to all)
+        full_rescan: Ignore the stored watermarks and examine every row (default: False)
+        limit: Maximum number of findings listed per rule (default: 100)
+
+    Returns:
+        Finding counts and items grouped by rule in a formatted string
+    """
+    unknown = [r for r in rules or [] if r not in anomalies.RULES]
+    if unknown:
+        return f"Error: Unknown rules: {', '.join(unknown)}"
+
+    try:
+        findings = anomalies.scan(rules, full_rescan, limit)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    return json.dumps(findings, indent=2, default=str)
+
+@mcp.tool()
+def sync_analytics_snapshot(full: bool = False) -> str:
+    """
+    Copy new and changed rows into the local analytics snapshot used by run_analytics_report.
+
+    Args:
+        full: Recopy every table instead of only rows changed since the last sync (default: False)
+
+    Returns:
+        Rows copied per table in a formatted string
+    """
+    return json.dumps(snapshot.sync(full), indent=2, default=str)
+
+@mcp.tool()
+def run_analytics_report(
+    report: Optional[str] = None,
+    sql: Optional[str] = None,
+    year: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+) -> str:
+    """
+    Run an aggregate report against the local analytics snapshot, without querying the database.
+
+    Reports: 'monthly_trend', 'department_comparison', 'leave_by_type' and
+    'overtime_by_month'. Alternatively pass a read-only SQLite SELECT in sql
+    over the tables departments, employees, schedules, attendance_records,
+    leaves and overtimes; it may use :year, :start_date and :end_date.
+
+    Args:
+        report: Name of a predefined report (optional if sql is provided)
+        sql: Ad-hoc SELECT statement (optional if report is provided)
+        year: Year for yearly reports (default: current year)
+        start_date: Start date in YYYY-MM-DD format (default: start of the year)
+        end_date: End date in YYYY-MM-DD format (default: end of the year)
+
+    Returns:
+        Report rows in a formatted string
+    """
+    if not report and not sql:
+        return "Error: Either report or sql must be provided"
+
+    if report and report not in snapshot.REPORTS:
+        return f"Error: Unknown report '{report}'. Available: {', '.join(snapshot.REPORTS)}"
+
+    year = year or date.today().year
+    params = {
+        "year": str(year),
+        "start_date": start_date or f"{year}-01-01",
+        "end_date": end_date or f"{year}-12-31",
+    }
+    try:
+        results = snapshot.run_report(report, sql, params)
+    except (ValueError, FileNotFoundError) as e:
+        return f"Error: {e}"
 
     if not results:
-        return "No attendance statistics found for the specified criteria"
+        return "No rows returned from the analytics snapshot"
 
-    return json.dumps([dict(r) for r in results], indent=2, default=str)
+    return json.dumps(results, indent=2, default=str)
 
 @mcp.tool()
 def get_holidays(
@@ -694,33 +1193,136 @@ def get_holidays(
     Returns:
         Holidays in a formatted string
     """
-    query = """
-    SELECT id, holiday_name, holiday_date, is_paid
-    FROM holidays
-    WHERE 1=1
-    """
-    params = []
+    query, params = query_compiler.HOLIDAYS.compile(year=year, month=month, is_paid=is_paid)
+    results = db.execute_query(query, params)
 
-    if year:
-        query += " AND EXTRACT(YEAR FROM holiday_date) = %s"
-        params.append(year)
+    if not results:
+        return "No holidays found with the specified criteria"
 
-    if month:
-        query += " AND EXTRACT(MONTH FROM holiday_date) = %s"
-        params.append(month)
+    return json.dumps([dict(r) for r in results], indent=2, default=str)
 
-    if is_paid is not None:
-        query += " AND is_paid = %s"
-        params.append(is_paid)
+# ==================== Batch Operations ====================
 
-    query += " ORDER BY holiday_date"
+# Tools that can be combined in run_batch, all running on the batch connection
+BATCH_OPERATIONS = {
+    fn.__name__: fn for fn in (
+        get_employee_info, list_employees, get_attendance_records, submit_attendance_record,
+        get_leave_requests, submit_leave_request, approve_leave_request,
+        bulk_approve_leave_requests, get_leave_balance, grant_leave_entitlement,
+        get_overtime_requests, submit_overtime_request, approve_overtime_request,
+        bulk_approve_overtime_requests, get_employee_schedule, assign_schedule,
+    )
+}
+
+_BATCH_REFERENCE = re.compile(r"^\$(\d+)\.id$")
+
+class _OperationFailed(Exception):
+    pass
+
+def _resolve_references(value, results):
+    """Replace '$<index>.id' values, also inside lists and dicts, with the ID created by an earlier operation"""
+    if isinstance(value, dict):
+        return {name: _resolve_references(item, results) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve_references(item, results) for item in value]
+    match = _BATCH_REFERENCE.match(value) if isinstance(value, str) else None
+    if not match:
+        return value
+    index = int(match.group(1))
+    # The last entry of results is the operation being resolved
+    if index >= len(results) - 1:
+        raise _OperationFailed(f"Error: {value} must refer to an earlier operation")
+    if results[index]["status"] != "ok":
+        raise _OperationFailed(f"Error: {value} refers to an operation that has not succeeded")
+    if results[index].get("id") is None:
+        raise _OperationFailed(f"Error: Operation {index} did not create a record to refer to")
+    return results[index]["id"]
+
+def _validate_arguments(tool, arguments):
+    """Validate batch arguments through the tool's argument model, as a direct tool call is"""
+    metadata = mcp._tool_manager.get_tool(tool).fn_metadata
+    try:
+        model = metadata.arg_model.model_validate(metadata.pre_parse_json(arguments))
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        raise _OperationFailed(f"Error: Invalid arguments for {tool}: {problems}")
+    return model.model_dump_one_level()
 
-    results = db.execute_query(query, params)
+@mcp.tool()
+def run_batch(
+    operations: List[Dict[str, Any]],
+    partial: bool = False
+) -> str:
+    """
+    Run several read and write tools in order in one transaction on one connection.
 
-    if not results:
-        return "No holidays found with the specified criteria"
+    Each operation is {"tool": <name>, "arguments": {...}}. An argument value of
+    the form "$<index>.id", also inside a list such as leave_ids, is replaced by
+    the ID created by an earlier operation, e.g. approve_overtime_request with
+    overtime_id "$0.id". Each operation's entry in the response carries the ID
+    it created as "id".
 
-    return json.dumps([dict(r) for r in results], indent=2, default=str)
+    Args:
+        operations: Ordered list of operations
+        partial: Skip failing operations and commit the rest, instead of rolling back everything (default: False)
+
+    Returns:
+        Whether the batch was committed and the result of each operation
+    """
+    if not operations:
+        return "Error: operations must not be empty"
+
+    for index, op in enumerate(operations):
+        if op.get("tool") not in BATCH_OPERATIONS:
+            return (f"Error: Operation {index} uses unknown tool {op.get('tool')!r}; "
+                    f"available: {', '.join(sorted(BATCH_OPERATIONS))}")
+
+    # The argument models of the batched tools are built with the tool schemas
+    mcp.register_pending_tools()
+
+    results = []
+    committed = False
+    error = None
+    try:
+        with db.batch() as conn:
+            for index, op in enumerate(operations):
+                entry = {"index": index, "tool": op["tool"]}
+                results.append(entry)
+                try:
+                    # Without partial, a failure abandons the batch, so no savepoint is needed
+                    with db.operation(conn) if partial else nullcontext():
+                        arguments = _validate_arguments(
+                            op["tool"], _resolve_references(op.get("arguments") or {}, results)
+                        )
+                        result = BATCH_OPERATIONS[op["tool"]](**arguments)
+                        if isinstance(result, str) and result.startswith("Error"):
+                            raise _OperationFailed(result)
+                    entry.update(status="ok", result=result)
+                    if isinstance(result, Created):
+                        entry["id"] = result.record_id
+                except Exception as e:
+                    entry.update(status="failed", result=str(e))
+                    if not partial:
+                        raise
+        committed = True
+    except Exception as e:
+        error = str(e)
+
+    if not committed:
+        for entry in results:
+            if entry["status"] == "ok":
+                entry["status"] = "rolled_back"
+        results += [{"index": i, "tool": op["tool"], "status": "not_run"}
+                    for i, op in enumerate(operations) if i >= len(results)]
+
+    # Schedules are added to the roster index as they are written; drop it if any were undone
+    if any(r["tool"] == "assign_schedule" and r["status"] in ("failed", "rolled_back") for r in results):
+        roster.roster.invalidate()
+
+    response = {"committed": committed, "operations": results}
+    if error:
+        response["error"] = error
+    return json.dumps(response, indent=2, default=str)
 
 # ==================== Resources ====================
 
@@ -733,18 +1335,35 @@ def get_employee_resource(employee_id: int) -> str:
         employee_id: The ID of the employee
 
     Returns:
-        Employee information in a formatted string
+        Employee information with its version in a formatted string
     """
-    query = """
-    SELECT * FROM employee_department_view
-    WHERE employee_id = %s
+    return resource_versions.read(
+        f"employee://{employee_id}", [employee_id], "employee_version", "employee_resource",
+        f"No employee found with ID: {employee_id}"
+    )
+
+@mcp.resource("employee://{employee_id}/if-none-match/{version}")
+def get_employee_resource_if_changed(employee_id: int, version: str) -> str:
     """
-    result = db.execute_query(query, [employee_id], fetch_one=True)
+    Get employee information unless the client already has the current version.
 
-    if not result:
-        return f"No employee found with ID: {employee_id}"
+    Args:
+        employee_id: The ID of the employee
+        version: Version from a previous read of employee://{employee_id}
 
-    return json.dumps(dict(result), indent=2, default=str)
+    Returns:
+        An "unchanged" answer, or employee information with its new version
+    """
+    return resource_versions.read(
+        f"employee://{employee_id}", [employee_id], "employee_version", "employee_resource",
+        f"No employee found with ID: {employee_id}", if_none_match=version
+    )
+
+def _department_statements():
+    """Return the version and payload statements for department resources"""
+    if resource_versions.member_versions_ready():
+        return "department_version", "department_resource"
+    return "department_version_counted", "department_resource_counted"
 
 @mcp.resource("department://{department_id}")
 def get_department_resource(department_id: int) -> str:
@@ -755,21 +1374,29 @@ def get_department_resource(department_id: int) -> str:
         department_id: The ID of the department
 
     Returns:
-        Department information in a formatted string
+        Department information with its version in a formatted string
     """
-    query = """
-    SELECT d.*,
-           (SELECT dept_name FROM departments p WHERE p.id = d.parent_id) as parent_name,
-           (SELECT COUNT(*) FROM employees e WHERE e.department_id = d.id) as employee_count
-    FROM departments d
-    WHERE d.id = %s
+    return resource_versions.read(
+        f"department://{department_id}", [department_id], *_department_statements(),
+        f"No department found with ID: {department_id}"
+    )
+
+@mcp.resource("department://{department_id}/if-none-match/{version}")
+def get_department_resource_if_changed(department_id: int, version: str) -> str:
     """
-    result = db.execute_query(query, [department_id], fetch_one=True)
+    Get department information unless the client already has the current version.
 
-    if not result:
-        return f"No department found with ID: {department_id}"
+    Args:
+        department_id: The ID of the department
+        version: Version from a previous read of department://{department_id}
 
-    return json.dumps(dict(result), indent=2, default=str)
+    Returns:
+        An "unchanged" answer, or department information with its new version
+    """
+    return resource_versions.read(
+        f"department://{department_id}", [department_id], *_department_statements(),
+        f"No department found with ID: {department_id}", if_none_match=version
+    )
 
 @mcp.resource("attendance://{employee_id}/{date}")
 def get_attendance_resource(employee_id: int, date: str) -> str:
@@ -781,18 +1408,66 @@ def get_attendance_resource(employee_id: int, date: str) -> str:
         date: The date in YYYY-MM-DD format
 
     Returns:
-        Attendance information in a formatted string
+        Attendance information with its version in a formatted string
     """
-    query = """
-    SELECT * FROM attendance_detail_view
-    WHERE employee_id = %s AND record_date = %s
+    return resource_versions.read(
+        f"attendance://{employee_id}/{date}", [employee_id, date], "attendance_version", "attendance_resource",
+        f"No attendance record found for employee ID {employee_id} on {date}"
+    )
+
+@mcp.resource("attendance://{employee_id}/{date}/if-none-match/{version}")
+def get_attendance_resource_if_changed(employee_id: int, date: str, version: str) -> str:
     """
-    result = db.execute_query(query, [employee_id, date], fetch_one=True)
+    Get attendance information unless the client already has the current version.
 
-    if not result:
-        return f"No attendance record found for employee ID {employee_id} on {date}"
+    Args:
+        employee_id: The ID of the employee
+        date: The date in YYYY-MM-DD format
+        version: Version from a previous read of attendance://{employee_id}/{date}
 
-    return json.dumps(dict(result), indent=2, default=str)
+    Returns:
+        An "unchanged" answer, or attendance information with its new version
+    """
+    return resource_versions.read(
+        f"attendance://{employee_id}/{date}", [employee_id, date], "attendance_version", "attendance_resource",
+        f"No attendance record found for employee ID {employee_id} on {date}", if_none_match=version
+    )
+
+@mcp.resource("snapshot://status")
+def get_snapshot_status() -> str:
+    """
+    Get the state of the local analytics snapshot.
+
+    Returns:
+        Row count, watermark and last sync time per table in a formatted string
+    """
+    try:
+        return json.dumps(snapshot.status(), indent=2, default=str)
+    except FileNotFoundError as e:
+        return f"Error: {e}"
+
+@mcp.resource("journal://status")
+def get_journal_status() -> str:
+    """
+    Get the state of the write-behind clock event journal.
+
+    Returns:
+        Queue depth, lag of the oldest queued event and flusher health in a formatted string
+    """
+    if not clock_journal.journal:
+        return json.dumps({"enabled": False}, indent=2)
+
+    return json.dumps(clock_journal.journal.status(), indent=2, default=str)
+
+@mcp.resource("db://stats")
+def get_db_stats() -> str:
+    """
+    Get database connection latency statistics.
+
+    Returns:
+        Cold wake-up, new connection and reuse latencies in a formatted string
+    """
+    return json.dumps(db.connection_stats(), indent=2, default=str)
 
 # ==================== Prompts ====================
 
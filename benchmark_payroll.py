@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import sys
+import time
+
+import numpy as np
+
+import payroll
+
+
+def make_month(employees=10000, days=30, seed=0):
+    """Build a synthetic month of columnar payroll data"""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, employees + 1)
+
+    # One attendance record per employee per working day, with some missing clock-outs
+    working = np.ones(days, dtype=bool)
+    working[5::7] = working[6::7] = False
+    work_days = np.flatnonzero(working)
+    att_ids = np.repeat(ids, len(work_days))
+    att_days = np.tile(work_days, employees)
+    clock_in = 540 + rng.normal(0, 10, len(att_ids))
+    clock_out = 1080 + rng.normal(0, 20, len(att_ids))
+    clock_out[rng.random(len(att_ids)) < 0.01] = np.nan
+
+    overtime_ids = rng.choice(ids, employees // 2)
+    leave_ids = rng.choice(ids, employees // 5)
+    leave_start = rng.integers(0, days - 3, len(leave_ids))
+
+    return {
+        "employees": {
+            "employee_id": ids.tolist(),
+            "employee_number": [f"E{i:06d}" for i in ids],
+            "employee_name": [f"Employee {i}" for i in ids],
+        },
+        "attendance": {
+            "employee_id": att_ids,
+            "day": att_days,
+            "clock_in_min": clock_in,
+            "clock_out_min": clock_out,
+        },
+        "schedules": {
+            "employee_id": ids,
+            "first_day": np.zeros(employees, dtype=np.int64),
+            "last_day": np.full(employees, days - 1),
+            "start_min": np.full(employees, 540.0),
+            "end_min": np.full(employees, 1080.0),
+        },
+        "overtimes": {
+            "employee_id": overtime_ids,
+            "hours": rng.uniform(1, 4, len(overtime_ids)),
+        },
+        "leaves": {
+            "employee_id": leave_ids,
+            "first_day": leave_start,
+            "last_day": leave_start + 2,
+            "leave_type": rng.choice(["Annual", "Sick", "Unpaid"], len(leave_ids)).tolist(),
+        },
+        "working": working,
+    }
+
+
+def run_benchmark(employees=10000, repeat=5):
+    """Time the vectorized payroll computation on synthetic data"""
+    data = make_month(employees)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = payroll.compute(data)
+        timings.append(time.perf_counter() - start)
+
+    print(f"Employees: {employees}")
+    print(f"Attendance rows: {len(data['attendance']['employee_id'])}")
+    print(f"compute(): best {min(timings) * 1000:.1f} ms, median {sorted(timings)[len(timings) // 2] * 1000:.1f} ms")
+    print(f"Total worked hours: {result['worked_hours'].sum():.0f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
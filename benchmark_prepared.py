@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+
+# Keep warmup, keepalive and journal threads from adding connections and load to the measurement
+os.environ.update({"DB_BACKGROUND": "0", "ATTENDANCE_WRITE_BEHIND": "0"})
+
+import db
+import attendance_mcp_server  # Registers the prepared statements
+
+
+def _time(cursor, run, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(cursor)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    cursor.connection.rollback()
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def run_benchmark(employee_id, record_date, repeat=200):
+    """Compare per-call latency of plain and prepared execution of the hot read statements"""
+    cases = {
+        "employee_by_id": [employee_id],
+        "attendance_version": [employee_id, record_date],
+        "attendance_record_id": [employee_id, record_date],
+    }
+
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cursor:
+            print(f"{'statement':24} {'plain ms':>10} {'prepared ms':>12} {'saved':>8}")
+            for name, params in cases.items():
+                numbered, _ = db._statements[name]
+                plain_sql = numbered
+                for i in range(len(params), 0, -1):
+                    plain_sql = plain_sql.replace(f"${i}", "%s")
+
+                plain = _time(cursor, lambda c: c.execute(plain_sql, params), repeat)
+                prepared = _time(cursor, lambda c: db.run_prepared(c, name, params), repeat)
+                print(f"{name:24} {plain:10.3f} {prepared:12.3f} {(1 - prepared / plain) * 100:7.1f}%")
+    finally:
+        db.release_connection(conn)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python benchmark_prepared.py EMPLOYEE_ID YYYY-MM-DD [REPEAT]")
+        sys.exit(1)
+    run_benchmark(int(sys.argv[1]), sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 200)
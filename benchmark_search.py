@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import random
+import sys
+import time
+
+import employee_search
+
+SURNAMES = ["Zhang", "Wang", "Li", "Liu", "Chen", "Yang", "Huang", "Zhao", "Wu", "Zhou",
+            "Smith", "Johnson", "Garcia", "Miller", "Davis", "Lopez", "Wilson", "Anderson"]
+GIVEN = ["Wei", "Fang", "Min", "Jing", "Lei", "Yan", "Jun", "Hui", "Anna", "James",
+         "Maria", "Robert", "Linda", "David", "Susan", "Daniel", "Karen", "Paul"]
+QUERIES = ["zhang", "Zhang Wei", "E0012", "Garcai", "li ya", "Andersn", "E09999", "Min"]
+
+
+def make_employees(count, seed=0):
+    """Build synthetic employee rows shaped like employee_department_view"""
+    rng = random.Random(seed)
+    return [{
+        "employee_id": i,
+        "employee_number": f"E{i:05d}",
+        "employee_name": f"{rng.choice(SURNAMES)} {rng.choice(GIVEN)}{rng.choice(GIVEN).lower()}",
+        "position": "Staff",
+        "department_id": rng.randint(1, 40),
+        "dept_name": "Department",
+        "employee_status": "Active" if rng.random() < 0.9 else "Inactive",
+    } for i in range(1, count + 1)]
+
+
+def run_benchmark(count=100000, repeat=20):
+    """Time building the in-process index and ranked top-10 searches"""
+    rows = make_employees(count)
+    start = time.perf_counter()
+    index = employee_search.TrigramIndex(rows)
+    print(f"Employees: {count}, index build: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for query in QUERIES:
+        for department_id in (None, 7):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = index.search(query, 10, department_id)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            top = results[0]["employee_name"] if results else "-"
+            print(f"  {query!r:12} dept={department_id!s:4} median {timings[len(timings) // 2] * 1000:6.2f} ms  top: {top}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
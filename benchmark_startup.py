@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attendance_mcp_server.py")
+
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {},
+        "clientInfo": {"name": "benchmark", "version": "1.0"},
+    },
+}
+INITIALIZED = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+LIST_TOOLS = {"jsonrpc": "2.0", "id": 2, "method": "tools/list"}
+
+
+def _send(proc, message):
+    proc.stdin.write(json.dumps(message) + "\n")
+    proc.stdin.flush()
+
+
+def _wait_for(proc, message_id):
+    while True:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError("Server exited before responding")
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue  # Not a protocol message
+        if message.get("id") == message_id:
+            return message
+
+
+def time_handshake():
+    """Start the server and time the initialize and first tools/list responses"""
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, SERVER],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        _send(proc, INITIALIZE)
+        _wait_for(proc, 1)
+        initialized = time.perf_counter() - started
+        _send(proc, INITIALIZED)
+        _send(proc, LIST_TOOLS)
+        _wait_for(proc, 2)
+        listed = time.perf_counter() - started
+    finally:
+        proc.kill()
+        proc.wait()
+    return initialized, listed
+
+
+def import_breakdown(top=15):
+    """Return the slowest modules imported by the server, by cumulative import time"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import attendance_mcp_server"],
+        cwd=os.path.dirname(SERVER),
+        capture_output=True,
+        text=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only top-level imports and direct children, to keep the report readable
+        if len(name) - len(name.lstrip()) > 3 or not cumulative.strip().isdigit():
+            continue
+        modules.append((int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def run_benchmark(repeat=5):
+    """Report time-to-initialize, time-to-tools/list and the import time breakdown"""
+    timings = [time_handshake() for _ in range(repeat)]
+    initialize = sorted(t[0] for t in timings)
+    tools = sorted(t[1] for t in timings)
+    print(f"initialize response: best {initialize[0] * 1000:.0f} ms, median {initialize[len(initialize) // 2] * 1000:.0f} ms")
+    print(f"first tools/list:    best {tools[0] * 1000:.0f} ms, median {tools[len(tools) // 2] * 1000:.0f} ms")
+
+    print("\nImport time by module (cumulative):")
+    for microseconds, name in import_breakdown():
+        print(f"  {microseconds / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
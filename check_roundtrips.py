@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+"""
+Count database round trips of every tool and resource against checked-in budgets.
+
+The server runs against an in-process stand-in for Postgres that answers
+every query with a few synthetic rows, so the counts depend only on the code
+paths.  Each case is run three times and the last call is measured, once
+caches are filled and statements prepared, as in a long-running server.
+For each case it records the most connections held at once, connection
+checkouts, statements sent, rows fetched and bytes of the response.  Exits
+with status 1 when a case exceeds its budget.
+
+    python check_roundtrips.py            # check against roundtrip_budgets.json
+    python check_roundtrips.py --update   # record the current counts as budgets
+"""
+
+import atexit
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime, time as dt_time
+
+# Isolate the server from the real database, write-behind journal and output files
+_workdir = tempfile.mkdtemp(prefix="roundtrips-")
+atexit.register(shutil.rmtree, _workdir, True)
+os.environ.update({
+    "DB_HOST": "",
+    "ATTENDANCE_WRITE_BEHIND": "0",
+    "PAYROLL_OUTPUT_DIR": _workdir,
+    "ANALYTICS_SNAPSHOT_PATH": os.path.join(_workdir, "snapshot.db"),
+})
+
+from psycopg2 import extensions
+
+import db
+import attendance_mcp_server as server
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "roundtrip_budgets.json")
+METRICS = ("connections", "checkouts", "statements", "rows", "bytes")
+# Response sizes may grow this much (e.g. with timings in db://stats); counts must not grow at all
+BYTES_TOLERANCE = 0.05
+# Rows returned by every statement that returns rows
+FIXTURE_ROWS = 3
+
+CASES = {
+    "get_employee_info": (server.get_employee_info, {"employee_id": 1}),
+    "get_employee_info_by_number": (server.get_employee_info, {"employee_number": "E001"}),
+    "list_employees": (server.list_employees, {"department_id": 1, "status": "Active"}),
+    "search_employees": (server.search_employees, {"query": "zhang"}),
+    "list_departments": (server.list_departments, {}),
+    "get_attendance_records": (server.get_attendance_records, {
+        "employee_id": 1, "start_date": "2024-01-01", "end_date": "2024-01-31"}),
+    "submit_attendance_record": (server.submit_attendance_record, {
+        "employee_id": 1, "record_date": "2024-01-15", "clock_in_time": "2024-01-15 09:00:00"}),
+    "get_leave_requests": (server.get_leave_requests, {"employee_id": 1, "status": "Pending"}),
+    "submit_leave_request": (server.submit_leave_request, {
+        "employee_id": 1, "leave_type": "Annual", "start_date": "2024-01-15",
+        "end_date": "2024-01-17", "reason": "Trip", "check_balance": True}),
+    "approve_leave_request": (server.approve_leave_request, {"leave_id": 1, "approved_by": 2}),
+    "get_leave_balance": (server.get_leave_balance, {"employee_id": 1, "year": 2024}),
+    "grant_leave_entitlement": (server.grant_leave_entitlement, {
+        "employee_id": 1, "leave_type": "Annual", "year": 2024, "days": 10}),
+    "get_overtime_requests": (server.get_overtime_requests, {"employee_id": 1}),
+    "submit_overtime_request": (server.submit_overtime_request, {
+        "employee_id": 1, "overtime_date": "2024-01-15", "start_time": "2024-01-15 18:00:00",
+        "end_time": "2024-01-15 20:00:00", "reason": "Release"}),
+    "approve_overtime_request": (server.approve_overtime_request, {"overtime_id": 1, "approved_by": 2}),
+    "bulk_approve_leave_requests": (server.bulk_approve_leave_requests, {
+        "approved_by": 2, "leave_ids": [1, 2, 3]}),
+    "bulk_approve_overtime_requests": (server.bulk_approve_overtime_requests, {
+        "approved_by": 2, "department_id": 1}),
+    "get_employee_schedule": (server.get_employee_schedule, {"employee_id": 1}),
+    "list_shifts": (server.list_shifts, {}),
+    "assign_schedule": (server.assign_schedule, {
+        "employee_id": 1, "shift_id": 1, "start_date": "2024-02-01", "end_date": "2024-02-29"}),
+    "get_roster": (server.get_roster, {"start_date": "2024-01-15", "end_date": "2024-01-21"}),
+    "get_on_shift": (server.get_on_shift, {"at": "2024-01-15 10:00:00"}),
+    "get_monthly_attendance_stats": (server.get_monthly_attendance_stats, {"year": 2024, "month": 1}),
+    "compute_payroll_attendance": (server.compute_payroll_attendance, {"year": 2024, "month": 1}),
+    "scan_attendance_anomalies": (server.scan_attendance_anomalies, {
+        "rules": list(server.anomalies.RULES)[:FIXTURE_ROWS]}),
+    "sync_analytics_snapshot": (server.sync_analytics_snapshot, {}),
+    "run_analytics_report": (server.run_analytics_report, {"report": "leave_by_type",
+                                                           "start_date": "2024-01-01",
+                                                           "end_date": "2024-12-31"}),
+    "get_holidays": (server.get_holidays, {"year": 2024}),
+    "run_batch": (server.run_batch, {"operations": [
+        {"tool": "submit_overtime_request", "arguments": {
+            "employee_id": 1, "overtime_date": "2024-01-15", "start_time": "2024-01-15 18:00:00",
+            "end_time": "2024-01-15 20:00:00", "reason": "Release"}},
+        {"tool": "approve_overtime_request", "arguments": {"overtime_id": "$0.id", "approved_by": 2}},
+    ]}),
+    "run_batch_partial": (server.run_batch, {"partial": True, "operations": [
+        {"tool": "submit_overtime_request", "arguments": {
+            "employee_id": 1, "overtime_date": "2024-01-15", "start_time": "2024-01-15 18:00:00",
+            "end_time": "2024-01-15 20:00:00", "reason": "Release"}},
+        {"tool": "approve_overtime_request", "arguments": {"overtime_id": "$0.id", "approved_by": 2}},
+    ]}),
+    "resource:employee": (server.get_employee_resource, {"employee_id": 1}),
+    "resource:department": (server.get_department_resource, {"department_id": 1}),
+    "resource:attendance": (server.get_attendance_resource, {"employee_id": 1, "date": "2024-01-15"}),
+    # The stand-in reports version "10" for every row, so these take the unchanged path
+    "resource:employee_if_none_match": (server.get_employee_resource_if_changed, {
+        "employee_id": 1, "version": "10"}),
+    "resource:department_if_none_match": (server.get_department_resource_if_changed, {
+        "department_id": 1, "version": "10"}),
+    "resource:attendance_if_none_match": (server.get_attendance_resource_if_changed, {
+        "employee_id": 1, "date": "2024-01-15", "version": "10"}),
+    "resource:snapshot_status": (server.get_snapshot_status, {}),
+    "resource:journal_status": (server.get_journal_status, {}),
+    "resource:db_stats": (server.get_db_stats, {}),
+}
+
+
+# ==================== In-process stand-in ====================
+
+_KEYWORD = re.compile(r"\b(SELECT|FROM|RETURNING)\b|[()]", re.I)
+_EXECUTE = re.compile(r"^\s*EXECUTE\s+(\w+)", re.I)
+_GENERIC_COLUMNS = ["id", "employee_id", "employee_number", "employee_name", "department_id",
+                    "dept_name", "status", "record_date", "start_date", "end_date"]
+# Columns whose values must match names the code looks up
+_FIXTURE_VALUES = {"scan_name": list(server.anomalies.RULES)}
+# Columns reported for every table when the snapshot sync reads information_schema
+_SNAPSHOT_COLUMNS = ["id", "employee_id", "department_id", "dept_name", "status", "record_date",
+                     "start_date", "duration", "leave_type", "hours", "overtime_date", "updated_at"]
+
+
+def _split_top_level(text):
+    items, depth, current = [], 0, ""
+    for char in text:
+        depth += char == "("
+        depth -= char == ")"
+        if char == "," and depth == 0:
+            items.append(current)
+            current = ""
+        else:
+            current += char
+    return items + [current]
+
+
+def _columns(query):
+    """Guess the result column names of a query from its outermost select or returning list"""
+    match = _EXECUTE.match(query)
+    if match:
+        query = db._statements[match.group(1)][0]
+
+    depth, start, end = 0, None, None
+    for token in _KEYWORD.finditer(query):
+        word = token.group(0).upper()
+        if word == "(":
+            depth += 1
+        elif word == ")":
+            depth -= 1
+        elif depth == 0 and word in ("SELECT", "RETURNING"):
+            start, end = token.end(), None
+        elif depth == 0 and word == "FROM" and start is not None and end is None:
+            end = token.start()
+    if start is None:
+        return _GENERIC_COLUMNS
+
+    names = []
+    for item in _split_top_level(query[start:end]):
+        item = item.strip().rstrip(";").strip()
+        if item == "*" or item.endswith(".*"):
+            names += _GENERIC_COLUMNS
+        elif item:
+            names.append(re.split(r"[\s.]", item)[-1].strip('"'))
+    return names
+
+
+def _value(column, index):
+    """Synthetic value typed after the column name"""
+    name = column.lower()
+    if name in _FIXTURE_VALUES:
+        return _FIXTURE_VALUES[name][index % len(_FIXTURE_VALUES[name])]
+    if name.startswith("is_"):
+        return False
+    if name.endswith("date") or name == "date":
+        return date(2024, 1, 15)
+    if name.endswith("_at") or name in ("clock_in_time", "clock_out_time", "watermark"):
+        return datetime(2024, 1, 15, 9, 0)
+    if name.endswith("_time"):
+        return dt_time(9 if name.startswith("start") else 18, 0)
+    if name.endswith("status"):
+        return "Pending"
+    if any(part in name for part in ("name", "number", "type", "code", "position", "reason",
+                                     "remark", "description", "rule", "detail", "bucket")):
+        return f"{column}-{index}"
+    return index + 10
+
+
+class _Cursor:
+    def __init__(self, conn, as_dict, named=False):
+        self.connection = conn
+        self.as_dict = as_dict
+        # A named (server-side) cursor sends each fetch to the server
+        self.named = named
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        recorder.statements += 1
+        self.connection.status = extensions.TRANSACTION_STATUS_INTRANS
+        text = query.strip().upper()
+        returns_rows = (text.startswith(("SELECT", "WITH", "EXECUTE"))
+                        or re.search(r"\bRETURNING\b", text) is not None)
+        if not returns_rows:
+            self.description = None
+            self.rowcount = FIXTURE_ROWS if text.startswith(("INSERT", "UPDATE", "DELETE")) else -1
+            self._rows = []
+            return
+        if "information_schema.columns" in query:
+            self._set_rows(["table_name", "column_name"],
+                           [(t, c) for t in server.snapshot.TABLES for c in _SNAPSHOT_COLUMNS])
+            return
+        names = _columns(query)
+        if names == ["id"] and text.startswith("SELECT"):
+            # Existence checks find nothing, so writes take their insert path
+            self._set_rows(names, [])
+            return
+        self._set_rows(names, [tuple(_value(n, i) for n in names) for i in range(FIXTURE_ROWS)])
+
+    def _set_rows(self, names, rows):
+        self.description = [extensions.Column(name=n) for n in names]
+        self._rows = [dict(zip(names, row)) if self.as_dict else row for row in rows]
+        self.rowcount = len(self._rows)
+
+    def executemany(self, query, params_list):
+        for params in params_list:
+            self.execute(query, params)
+
+    def fetchone(self):
+        if not self._rows:
+            return None
+        recorder.rows += 1
+        return self._rows.pop(0)
+
+    def fetchmany(self, size):
+        if self.named:
+            recorder.statements += 1
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        recorder.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        recorder.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class _Info:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @property
+    def transaction_status(self):
+        return self.conn.status
+
+
+class _Connection:
+    """Stand-in for db.PooledConnection, keeping its batch savepoint behaviour"""
+
+    def __init__(self):
+        self.closed = False
+        self.prepared = set()
+        self.batched = False
+        self.savepoint = None
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.info = _Info(self)
+
+    def cursor(self, name=None, cursor_factory=None):
+        return _Cursor(self, cursor_factory is not None, name is not None)
+
+    def commit(self):
+        if not self.batched:
+            self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        if self.savepoint is None:
+            self.status = extensions.TRANSACTION_STATUS_IDLE
+        else:
+            recorder.statements += 1
+
+    def close(self):
+        self.closed = True
+
+
+class _Recorder:
+    def reset(self):
+        self.held = set()
+        self.connections = self.checkouts = self.statements = self.rows = 0
+
+    def snapshot(self, result):
+        return {
+            "connections": self.connections,
+            "checkouts": self.checkouts,
+            "statements": self.statements,
+            "rows": self.rows,
+            "bytes": len(str(result).encode()),
+        }
+
+
+recorder = _Recorder()
+recorder.reset()
+_get_connection = db.get_connection
+_release_connection = db.release_connection
+
+
+def _checkout(_keepalive=False):
+    conn = _get_connection(_keepalive)
+    if not _keepalive:
+        recorder.checkouts += 1
+        recorder.held.add(id(conn))
+        recorder.connections = max(recorder.connections, len(recorder.held))
+    return conn
+
+
+def _release(conn):
+    # The connection of a running batch stays held until the batch ends
+    if conn is not getattr(db._batch, "conn", None):
+        recorder.held.discard(id(conn))
+    _release_connection(conn)
+
+
+db._connect = _Connection
+db.get_connection = _checkout
+db.release_connection = _release
+
+
+# ==================== Measurement ====================
+
+def measure():
+    """Run every case three times and return the counts of the last call"""
+    counts, failures = {}, {}
+    for name, (fn, arguments) in CASES.items():
+        for _ in range(3):
+            recorder.reset()
+            try:
+                result = fn(**arguments)
+            except Exception as e:
+                result = f"Exception: {e}"
+        counts[name] = recorder.snapshot(result)
+        if str(result).startswith(("Error", "Exception")):
+            failures[name] = str(result).splitlines()[0]
+    return counts, failures
+
+
+def main():
+    counts, failures = measure()
+    for name, message in failures.items():
+        print(f"note: {name} failed under the stand-in: {message}")
+
+    if "--update" in sys.argv:
+        with open(BUDGETS_PATH, "w") as f:
+            json.dump(counts, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Wrote budgets for {len(counts)} cases to {BUDGETS_PATH}")
+        return 0
+
+    with open(BUDGETS_PATH) as f:
+        budgets = json.load(f)
+
+    over = []
+    print(f"{'case':32} " + " ".join(f"{m:>12}" for m in METRICS))
+    for name, measured in counts.items():
+        budget = budgets.get(name)
+        if budget is None:
+            over.append(f"{name}: no budget recorded")
+            continue
+        cells = []
+        for metric in METRICS:
+            cells.append(f"{measured[metric]:>5}/{budget[metric]:<6}")
+            limit = budget[metric] * (1 + BYTES_TOLERANCE) if metric == "bytes" else budget[metric]
+            if measured[metric] > limit:
+                over.append(f"{name}: {metric} {measured[metric]} > budget {budget[metric]}")
+        print(f"{name:32} " + " ".join(cells))
+
+    if over:
+        print("\nOver budget:")
+        for line in over:
+            print(f"  {line}")
+        return 1
+    print("\nAll cases within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
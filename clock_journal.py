@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+
+import atexit
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import psycopg2
+import psycopg2.errors
+
+import db
+
+# Write-behind mode: clock events are acknowledged once they are in the local
+# journal and merged into attendance_records by a background flusher.
+ENABLED = os.getenv("ATTENDANCE_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+JOURNAL_PATH = os.getenv("CLOCK_JOURNAL_PATH", "attendance_journal.db")
+FLUSH_INTERVAL_SECONDS = float(os.getenv("CLOCK_JOURNAL_FLUSH_INTERVAL", "1"))
+FLUSH_BATCH_SIZE = int(os.getenv("CLOCK_JOURNAL_BATCH_SIZE", "500"))
+MAX_BACKOFF_SECONDS = float(os.getenv("CLOCK_JOURNAL_MAX_BACKOFF", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance_event_keys (
+    idempotency_key VARCHAR(64) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Applies collapsed events: update the day's record if there is one, insert otherwise
+MERGE_QUERY = """
+WITH events AS (
+    SELECT * FROM unnest(%s::int[], %s::date[], %s::timestamp[], %s::timestamp[], %s::varchar[], %s::text[])
+        AS e(employee_id, record_date, clock_in_time, clock_out_time, status, remark)
+),
+updated AS (
+    UPDATE attendance_records a
+    SET
+        clock_in_time = COALESCE(e.clock_in_time, a.clock_in_time),
+        clock_out_time = COALESCE(e.clock_out_time, a.clock_out_time),
+        status = e.status,
+        remark = COALESCE(e.remark, a.remark),
+        updated_at = CURRENT_TIMESTAMP
+    FROM events e
+    WHERE a.employee_id = e.employee_id AND a.record_date = e.record_date
+    RETURNING a.employee_id, a.record_date
+)
+INSERT INTO attendance_records
+(employee_id, record_date, clock_in_time, clock_out_time, status, remark)
+SELECT e.employee_id, e.record_date, e.clock_in_time, e.clock_out_time, e.status, e.remark
+FROM events e
+WHERE NOT EXISTS (
+    SELECT 1 FROM updated u
+    WHERE u.employee_id = e.employee_id AND u.record_date = e.record_date
+)
+"""
+
+FIELDS = ("employee_id", "record_date", "clock_in_time", "clock_out_time", "status", "remark")
+
+# Length of attendance_event_keys.idempotency_key
+MAX_KEY_LENGTH = 64
+# Dead-lettered events listed by status()
+DEAD_LETTERS_SHOWN = 10
+
+
+def _is_connection_error(error):
+    """Whether a flush failed because the database was unreachable, so retrying may succeed"""
+    return isinstance(error, psycopg2.OperationalError) or isinstance(
+        error.__cause__, psycopg2.OperationalError)
+
+
+def _is_unique_violation(error):
+    """Whether a flush lost an insert race for the same employee and day"""
+    return isinstance(error, psycopg2.errors.UniqueViolation) or isinstance(
+        error.__cause__, psycopg2.errors.UniqueViolation)
+
+
+def create_schema():
+    """Create the applied-key table; run once by an administrator (python clock_journal.py)"""
+    db.execute_query(SCHEMA)
+
+
+def validate(employee_id, record_date, clock_in_time, clock_out_time, idempotency_key):
+    """Raise ValueError for an event the database would reject, before it is acknowledged"""
+    if not isinstance(employee_id, int):
+        raise ValueError(f"employee_id must be an integer, got {employee_id!r}")
+    try:
+        datetime.strptime(record_date, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError(f"record_date must be in YYYY-MM-DD format, got {record_date!r}")
+    for name, value in (("clock_in_time", clock_in_time), ("clock_out_time", clock_out_time)):
+        if value is None:
+            continue
+        try:
+            datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be in YYYY-MM-DD HH:MM:SS format, got {value!r}")
+    if idempotency_key is not None and len(idempotency_key) > MAX_KEY_LENGTH:
+        raise ValueError(f"idempotency_key must be at most {MAX_KEY_LENGTH} characters")
+
+
+class ClockJournal:
+    """Durable local queue of clock events backed by a SQLite file in WAL mode"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            employee_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            clock_in_time TEXT,
+            clock_out_time TEXT,
+            status TEXT NOT NULL,
+            remark TEXT,
+            enqueued_at REAL NOT NULL
+        )
+        """)
+        # Events the database rejected; kept for inspection instead of blocking the queue
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS dead_events (
+            seq INTEGER PRIMARY KEY,
+            idempotency_key TEXT NOT NULL,
+            employee_id INTEGER NOT NULL,
+            record_date TEXT NOT NULL,
+            clock_in_time TEXT,
+            clock_out_time TEXT,
+            status TEXT NOT NULL,
+            remark TEXT,
+            enqueued_at REAL NOT NULL,
+            error TEXT NOT NULL,
+            failed_at REAL NOT NULL
+        )
+        """)
+        self._wake = threading.Event()
+        self._thread = None
+        self._schema_ready = False
+        self.failures = 0
+        self.last_error = None
+        self.last_flush_at = None
+        self.flushed_total = 0
+
+    def append(self, employee_id, record_date, clock_in_time, clock_out_time, status, remark,
+               idempotency_key=None):
+        """Durably record an event; return its idempotency key"""
+        validate(employee_id, record_date, clock_in_time, clock_out_time, idempotency_key)
+        key = idempotency_key or uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("""
+            INSERT OR IGNORE INTO events
+            (idempotency_key, employee_id, record_date, clock_in_time, clock_out_time, status, remark, enqueued_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (key, employee_id, record_date, clock_in_time, clock_out_time, status, remark, time.time()))
+        self._wake.set()
+        return key
+
+    def _pending(self, limit):
+        with self._lock:
+            return self._conn.execute(f"""
+            SELECT seq, idempotency_key, {', '.join(FIELDS)}
+            FROM events ORDER BY seq LIMIT ?
+            """, (limit,)).fetchall()
+
+    def _delete(self, first_seq, last_seq):
+        with self._lock:
+            self._conn.execute("DELETE FROM events WHERE seq BETWEEN ? AND ?", (first_seq, last_seq))
+
+    def _dead_letter(self, seq, error):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("""
+            INSERT OR REPLACE INTO dead_events
+            SELECT *, ?, ? FROM events WHERE seq = ?
+            """, (str(error), time.time(), seq))
+            self._conn.execute("DELETE FROM events WHERE seq = ?", (seq,))
+            self._conn.execute("COMMIT")
+
+    def flush_once(self, limit=FLUSH_BATCH_SIZE):
+        """
+        Merge one batch of events into attendance_records; return how many were taken.
+
+        When the database rejects the batch, its events are applied one at a
+        time and those it still rejects are moved to the dead-letter table, so
+        one bad event cannot hold back the rest of the queue.  Connection
+        errors are raised and the batch is retried later.
+        """
+        events = self._pending(limit)
+        if not events:
+            return 0
+
+        # The server does not create the key table itself; events stay queued until it exists
+        if not self._schema_ready:
+            row = db.execute_query(
+                "SELECT to_regclass('attendance_event_keys') IS NOT NULL AS ready", fetch_one=True
+            )
+            if not (row and row["ready"]):
+                raise RuntimeError("attendance_event_keys is missing; run 'python clock_journal.py' to create it")
+            self._schema_ready = True
+
+        try:
+            self._apply(events)
+            self._delete(events[0][0], events[-1][0])
+            self.flushed_total += len(events)
+        except Exception as e:
+            if _is_connection_error(e):
+                raise
+            for event in events:
+                try:
+                    self._apply_one(event)
+                except Exception as event_error:
+                    if _is_connection_error(event_error):
+                        raise
+                    self._dead_letter(event[0], event_error)
+                else:
+                    self._delete(event[0], event[0])
+                    self.flushed_total += 1
+
+        self.last_flush_at = time.time()
+        return len(events)
+
+    def _apply_one(self, event):
+        """
+        Apply a single event.
+
+        A synchronous write may insert the same employee and day between the
+        merge's update and insert.  The event is then retried, now taking the
+        update path, and if it loses the race again the record written
+        concurrently is kept and the event counts as applied.
+        """
+        for _ in range(2):
+            try:
+                self._apply([event])
+                return
+            except Exception as e:
+                if not _is_unique_violation(e):
+                    raise
+
+    def _apply(self, events):
+        """Apply events to attendance_records in one transaction, skipping already applied keys"""
+        with db.transaction() as cursor:
+            # Keys already applied by an earlier flush whose local delete was lost are skipped
+            cursor.execute("""
+            INSERT INTO attendance_event_keys (idempotency_key)
+            SELECT unnest(%s::varchar[])
+            ON CONFLICT (idempotency_key) DO NOTHING
+            RETURNING idempotency_key
+            """, [[e[1] for e in events]])
+            fresh = {row["idempotency_key"] for row in cursor.fetchall()}
+
+            # Fold events for the same employee and day in arrival order
+            merged = {}
+            for event in events:
+                if event[1] not in fresh:
+                    continue
+                values = dict(zip(FIELDS, event[2:]))
+                current = merged.setdefault((values["employee_id"], values["record_date"]), values)
+                if current is not values:
+                    for field in ("clock_in_time", "clock_out_time", "remark"):
+                        if values[field] is not None:
+                            current[field] = values[field]
+                    current["status"] = values["status"]
+
+            if merged:
+                rows = list(merged.values())
+                cursor.execute(MERGE_QUERY, [[r[f] for r in rows] for f in FIELDS])
+
+    def status(self):
+        """Return queue depth, lag of the oldest unflushed event and the latest dead-lettered events"""
+        with self._lock:
+            depth, oldest = self._conn.execute(
+                "SELECT COUNT(*), MIN(enqueued_at) FROM events"
+            ).fetchone()
+            dead_count = self._conn.execute("SELECT COUNT(*) FROM dead_events").fetchone()[0]
+            dead = self._conn.execute("""
+            SELECT idempotency_key, employee_id, record_date, clock_in_time, clock_out_time,
+                   status, error, failed_at
+            FROM dead_events ORDER BY failed_at DESC LIMIT ?
+            """, (DEAD_LETTERS_SHOWN,)).fetchall()
+        return {
+            "enabled": ENABLED,
+            "queue_depth": depth,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "flushed_total": self.flushed_total,
+            "last_flush_at": self.last_flush_at,
+            "consecutive_failures": self.failures,
+            "last_error": self.last_error,
+            "dead_letter_count": dead_count,
+            "dead_letters": [
+                dict(zip(("idempotency_key", "employee_id", "record_date", "clock_in_time",
+                          "clock_out_time", "status", "error", "failed_at"), row))
+                for row in dead
+            ],
+        }
+
+    def _run(self):
+        while True:
+            try:
+                while self.flush_once():
+                    pass
+                self.failures = 0
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"Clock journal flush failed (attempt {self.failures}): {e}", file=sys.stderr)
+                backoff = min(MAX_BACKOFF_SECONDS, FLUSH_INTERVAL_SECONDS * 2 ** self.failures)
+                time.sleep(random.uniform(backoff / 2, backoff))
+                continue
+            self._wake.wait(FLUSH_INTERVAL_SECONDS)
+            self._wake.clear()
+
+    def start(self):
+        """Start the background flusher, draining anything left from a previous run"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="clock-journal-flusher", daemon=True)
+            self._thread.start()
+            atexit.register(self._final_flush)
+
+    def _final_flush(self):
+        try:
+            while self.flush_once():
+                pass
+        except Exception as e:
+            print(f"Clock journal final flush failed, events stay queued: {e}", file=sys.stderr)
+
+
+journal = ClockJournal(JOURNAL_PATH) if ENABLED else None
+
+
+if __name__ == "__main__":
+    create_schema()
+    print("Clock journal key table is ready")
@@ -1,5 +1,12 @@
 import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.errors
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
@@ -13,18 +20,206 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_PORT = os.getenv("DB_PORT", "5432")
 
-def get_connection():
-    """Create and return a database connection"""
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        dbname=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        port=DB_PORT,
-        sslmode='require'  # Add SSL mode to require secure connection
-    )
+# Connection reuse and serverless wake-up tuning
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "4"))
+DB_CONNECT_BACKOFF = float(os.getenv("DB_CONNECT_BACKOFF", "0.5"))
+DB_VALIDATE_AFTER_SECONDS = float(os.getenv("DB_VALIDATE_AFTER_SECONDS", "30"))
+DB_KEEPALIVE_SECONDS = float(os.getenv("DB_KEEPALIVE_SECONDS", "120"))
+DB_KEEPALIVE_IDLE_TIMEOUT = float(os.getenv("DB_KEEPALIVE_IDLE_TIMEOUT", "900"))
+DB_COLD_THRESHOLD_SECONDS = float(os.getenv("DB_COLD_THRESHOLD_SECONDS", "0.5"))
+DB_BACKGROUND = os.getenv("DB_BACKGROUND", "1") != "0"
+
+_pool_lock = threading.Lock()
+_idle = []  # (connection, last used) pairs, most recently used last
+_last_activity = 0.0
+_background_started = False
+_stats = {
+    name: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+    for name in ("cold_connect", "warm_connect", "reuse")
+}
+_stats_retries = 0
+_stats_lock = threading.Lock()
+_batch = threading.local()  # connection shared by every query of a running batch, per thread
+
+# Connection failures that waiting will not fix: bad credentials, unknown
+# database or role, rejected by pg_hba.conf, bad connection options
+PERMANENT_SQLSTATE_CLASSES = ("28", "3D")
+PERMANENT_CONNECT_ERRORS = (
+    "authentication failed",
+    "does not exist",
+    "no pg_hba.conf entry",
+    "invalid connection option",
+    "invalid sslmode value",
+    "could not translate host name",
+)
+
+def _record(name, seconds):
+    ms = seconds * 1000
+    with _stats_lock:
+        entry = _stats[name]
+        entry["count"] += 1
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+        entry["last_ms"] = ms
+
+def _is_transient(error):
+    """Return whether a failed connect is worth retrying; libpq errors on connect usually carry no SQLSTATE"""
+    if error.pgcode:
+        return error.pgcode[:2] not in PERMANENT_SQLSTATE_CLASSES
+    message = str(error).lower()
+    return not any(marker in message for marker in PERMANENT_CONNECT_ERRORS)
+
+def _connect():
+    """Open a new connection, retrying transient failures while the database wakes up"""
+    global _stats_retries
+    started = time.perf_counter()
+    for attempt in range(DB_CONNECT_RETRIES + 1):
+        try:
+            conn = psycopg2.connect(
+                host=DB_HOST,
+                dbname=DB_NAME,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                port=DB_PORT,
+                sslmode='require',  # Add SSL mode to require secure connection
+                connection_factory=PooledConnection
+            )
+            break
+        except psycopg2.OperationalError as e:
+            if attempt == DB_CONNECT_RETRIES or not _is_transient(e):
+                raise
+            with _stats_lock:
+                _stats_retries += 1
+            backoff = DB_CONNECT_BACKOFF * 2 ** attempt
+            time.sleep(random.uniform(backoff / 2, backoff))
+    elapsed = time.perf_counter() - started
+    _record("cold_connect" if elapsed >= DB_COLD_THRESHOLD_SECONDS else "warm_connect", elapsed)
     return conn
 
+class PooledConnection(extensions.connection):
+    """Connection that remembers which registered statements it has prepared"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.batched = False
+        self.savepoint = None
+
+    def commit(self):
+        # Inside a batch, work stays in the batch transaction until the batch ends
+        if not self.batched:
+            super().commit()
+
+    def rollback(self):
+        # Inside a batch, only the current operation is undone
+        if self.savepoint is None:
+            super().rollback()
+        else:
+            with self.cursor() as cursor:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {self.savepoint}")
+
+def _is_alive(conn):
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        conn.close()
+        return False
+
+def get_connection(_keepalive=False):
+    """Return a database connection, reusing an idle one when possible"""
+    global _last_activity
+    if not _keepalive:
+        _last_activity = time.monotonic()
+
+    conn = getattr(_batch, "conn", None)
+    if conn is not None and not _keepalive:
+        return conn
+
+    while True:
+        with _pool_lock:
+            conn, last_used = _idle.pop() if _idle else (None, 0.0)
+        if conn is None:
+            return _connect()
+
+        started = time.perf_counter()
+        # A connection idle for a while may have been dropped when the compute suspended
+        if conn.closed or (time.monotonic() - last_used > DB_VALIDATE_AFTER_SECONDS
+                           and not _is_alive(conn)):
+            continue
+        _record("reuse", time.perf_counter() - started)
+        return conn
+
+def release_connection(conn):
+    """Return a connection to the idle pool, or close it if it is broken or the pool is full"""
+    if conn.closed or conn is getattr(_batch, "conn", None):
+        return
+    status = conn.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        conn.close()
+        return
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+            return
+    with _pool_lock:
+        if len(_idle) < DB_POOL_SIZE:
+            _idle.append((conn, time.monotonic()))
+            return
+    conn.close()
+
+def _ping():
+    conn = get_connection(_keepalive=True)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    finally:
+        release_connection(conn)
+
+def _keepalive_loop():
+    while True:
+        time.sleep(DB_KEEPALIVE_SECONDS)
+        if time.monotonic() - _last_activity > DB_KEEPALIVE_IDLE_TIMEOUT:
+            continue
+        try:
+            _ping()
+        except Exception as e:
+            # Keep the thread alive; the next tick tries again
+            print(f"Database keepalive failed: {e}", file=sys.stderr)
+
+def _warmup():
+    try:
+        _ping()
+    except Exception as e:
+        print(f"Database warmup failed: {e}", file=sys.stderr)
+
+def start_background():
+    """Wake the database and fill the pool in the background, then keep it warm while in use"""
+    global _background_started, _last_activity
+    if _background_started or not DB_HOST or not DB_BACKGROUND:
+        return
+    _background_started = True
+    _last_activity = time.monotonic()
+    threading.Thread(target=_warmup, name="db-warmup", daemon=True).start()
+    if DB_KEEPALIVE_SECONDS > 0:
+        threading.Thread(target=_keepalive_loop, name="db-keepalive", daemon=True).start()
+
+def connection_stats():
+    """Return connection latency statistics split into cold wake-ups, new warm connections and reuse"""
+    stats = {}
+    with _stats_lock:
+        for name, entry in _stats.items():
+            stats[name] = dict(entry, avg_ms=round(entry["total_ms"] / entry["count"], 2) if entry["count"] else 0.0)
+        stats["connect_retries"] = _stats_retries
+    with _pool_lock:
+        stats["idle_connections"] = len(_idle)
+    return stats
+
 def execute_query(query, params=None, fetch_one=False):
     """Execute a query and return the results"""
     conn = None
@@ -32,15 +227,19 @@ def execute_query(query, params=None, fetch_one=False):
         conn = get_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(query, params)
-            if query.strip().upper().startswith(("SELECT", "WITH")):
+            result = None
+            if cursor.description is not None:
                 if fetch_one:
                     result = cursor.fetchone()
                 else:
                     result = cursor.fetchall()
+            if query.strip().upper().startswith("SELECT"):
                 return result
-            else:
-                conn.commit()
-                return cursor.rowcount
+            # Writes (including UPDATE ... RETURNING and data-modifying WITH)
+            conn.commit()
+            if cursor.description is not None:
+                return result
+            return cursor.rowcount
     except psycopg2.OperationalError as e:
         # Handle connection errors specifically
         error_msg = f"Database connection error: {str(e)}"
@@ -54,23 +253,124 @@ def execute_query(query, params=None, fetch_one=False):
         raise Exception(error_msg) from e
     finally:
         if conn:
-            conn.close()
+            release_connection(conn)
 
-def execute_transaction(queries_and_params):
-    """Execute multiple queries in a transaction"""
+def execute_columnar(query, params=None):
+    """Execute a read query and return the result as a dict of column lists"""
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            names = [column.name for column in cursor.description]
+            rows = cursor.fetchall()
+            columns = list(zip(*rows)) if rows else [()] * len(names)
+            return {name: list(column) for name, column in zip(names, columns)}
+    except psycopg2.OperationalError as e:
+        # Handle connection errors specifically
+        error_msg = f"Database connection error: {str(e)}"
+        print(error_msg)  # Log the error
+        raise Exception(error_msg) from e
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        error_msg = f"Database error: {str(e)}"
+        print(error_msg)  # Log the error
+        raise Exception(error_msg) from e
+    finally:
+        if conn:
+            release_connection(conn)
+
+def iter_query(query, params=None, batch_size=100):
+    """
+    Yield the rows of a read query, fetched in batches through a server-side cursor.
+
+    Only the batches consumed are sent by the server, so a caller can stop
+    early; close the generator to release the connection right away.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        # A named cursor keeps the result on the server until it is fetched
+        with conn.cursor("iter_query", cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                yield from rows
+                # A short batch is the last one, so no empty fetch is needed to find the end
+                if len(rows) < batch_size:
+                    return
+    except psycopg2.OperationalError as e:
+        # Handle connection errors specifically
+        error_msg = f"Database connection error: {str(e)}"
+        print(error_msg)  # Log the error
+        raise Exception(error_msg) from e
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        error_msg = f"Database error: {str(e)}"
+        print(error_msg)  # Log the error
+        raise Exception(error_msg) from e
+    finally:
+        if conn:
+            release_connection(conn)
+
+# Registered hot statements, executed by name with server-side PREPARE
+_statements = {}
+
+def register_statement(name, query):
+    """Register a fixed-shape query (with %s placeholders) to be prepared once per connection"""
+    parts = query.split("%s")
+    numbered = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+    _statements[name] = (numbered, len(parts) - 1)
+
+def run_prepared(cursor, name, params=None):
+    """
+    Execute a registered statement on a cursor, preparing it on this connection first if needed.
+
+    A statement that was dropped or invalidated by a schema change is prepared
+    again and retried, unless it failed inside an already open transaction.
+    """
+    conn = cursor.connection
+    numbered, count = _statements[name]
+    params = list(params or [])
+    execute = f"EXECUTE {name}" + (f" ({', '.join(['%s'] * count)})" if count else "")
+
+    for attempt in range(2):
+        idle = conn.info.transaction_status == extensions.TRANSACTION_STATUS_IDLE
+        if name not in conn.prepared:
+            cursor.execute(f"PREPARE {name} AS {numbered}")
+            conn.prepared.add(name)
+        try:
+            cursor.execute(execute, params)
+            return
+        except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.FeatureNotSupported):
+            conn.prepared.discard(name)
+            if attempt or not idle:
+                raise
+            conn.rollback()
+            cursor.execute("DEALLOCATE PREPARE ALL")
+            conn.prepared.clear()
+
+def execute_prepared(name, params=None, fetch_one=False):
+    """Execute a registered statement and return the results like execute_query"""
     conn = None
     try:
         conn = get_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            results = []
-            for query, params in queries_and_params:
-                cursor.execute(query, params)
-                if query.strip().upper().startswith(("SELECT", "WITH")):
-                    results.append(cursor.fetchall())
+            run_prepared(cursor, name, params)
+            result = None
+            if cursor.description is not None:
+                if fetch_one:
+                    result = cursor.fetchone()
                 else:
-                    results.append(cursor.rowcount)
+                    result = cursor.fetchall()
+            if _statements[name][0].lstrip().upper().startswith("SELECT"):
+                return result
             conn.commit()
-            return results
+            if cursor.description is not None:
+                return result
+            return cursor.rowcount
     except psycopg2.OperationalError as e:
         # Handle connection errors specifically
         error_msg = f"Database connection error: {str(e)}"
@@ -84,4 +384,92 @@ def execute_transaction(queries_and_params):
         raise Exception(error_msg) from e
     finally:
         if conn:
-            conn.close()
+            release_connection(conn)
+
+@contextmanager
+def transaction():
+    """Yield a cursor whose statements are committed together, or rolled back on error"""
+    conn = None
+    try:
+        conn = get_connection()
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            yield cursor
+        conn.commit()
+    except psycopg2.OperationalError as e:
+        # Handle connection errors specifically
+        error_msg = f"Database connection error: {str(e)}"
+        print(error_msg)  # Log the error
+        raise Exception(error_msg) from e
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        error_msg = f"Database error: {str(e)}"
+        print(error_msg)  # Log the error
+        raise Exception(error_msg) from e
+    finally:
+        if conn:
+            release_connection(conn)
+
+@contextmanager
+def batch():
+    """
+    Run every query issued by this thread inside the block on one connection
+    and in one transaction, committed when the block ends without an error.
+
+    Commits made by the code inside are deferred to the end of the batch,
+    and a rollback abandons the whole batch.  To go on after a failure,
+    wrap each unit of work in operation() so a failure rolls back only that
+    unit; all-or-nothing batches need no savepoints.
+    """
+    if getattr(_batch, "conn", None) is not None:
+        raise RuntimeError("A batch is already running on this thread")
+    conn = get_connection()
+    conn.batched = True
+    _batch.conn = conn
+    try:
+        yield conn
+        conn.batched = False
+        conn.savepoint = None
+        conn.commit()
+    except psycopg2.OperationalError as e:
+        error_msg = f"Database connection error: {str(e)}"
+        print(error_msg)  # Log the error
+        raise Exception(error_msg) from e
+    finally:
+        conn.batched = False
+        conn.savepoint = None
+        _batch.conn = None
+        release_connection(conn)
+
+@contextmanager
+def operation(conn, name="batch_operation"):
+    """Run one unit of work of a batch under a savepoint, rolling back to it if the block raises"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"SAVEPOINT {name}")
+    conn.savepoint = name
+    try:
+        yield
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.savepoint = None
+        if conn.info.transaction_status == extensions.TRANSACTION_STATUS_INTRANS:
+            with conn.cursor() as cursor:
+                cursor.execute(f"RELEASE SAVEPOINT {name}")
+
+def in_batch():
+    """Return whether this thread is running a batch"""
+    return getattr(_batch, "conn", None) is not None
+
+def execute_transaction(queries_and_params):
+    """Execute multiple queries in a transaction"""
+    with transaction() as cursor:
+        results = []
+        for query, params in queries_and_params:
+            cursor.execute(query, params)
+            if cursor.description is not None:
+                results.append(cursor.fetchall())
+            else:
+                results.append(cursor.rowcount)
+        return results
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+import bisect
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+import db
+
+# How long the in-process index is used before employees are reloaded
+SEARCH_INDEX_TTL_SECONDS = float(os.getenv("SEARCH_INDEX_TTL_SECONDS", "300"))
+# Minimum trigram similarity for a fuzzy match, as pg_trgm's default threshold
+SIMILARITY_THRESHOLD = 0.3
+
+SEARCH_COLUMNS = """
+employee_id, employee_number, employee_name, position, department_id, dept_name, employee_status
+"""
+
+# Built CONCURRENTLY so writes to employees are not blocked; each must be its own statement
+TRGM_INDEXES = (
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_employees_name_trgm"
+    " ON employees USING gin (name gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_employees_number_trgm"
+    " ON employees USING gin (employee_number gin_trgm_ops)",
+)
+
+TRGM_INSTALLED_QUERY = """
+SELECT COUNT(*) AS present FROM pg_indexes
+WHERE tablename = 'employees'
+  AND indexname IN ('idx_employees_name_trgm', 'idx_employees_number_trgm')
+  AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+"""
+
+# Ranks prefixes of the name, a word of it or the number first, then by trigram
+# similarity to the closest word run of the name or to the number
+TRGM_QUERY = f"""
+SELECT {SEARCH_COLUMNS},
+       GREATEST(
+           CASE WHEN employee_name ILIKE %(prefix)s OR employee_name ILIKE %(word_prefix)s
+                     OR employee_number ILIKE %(prefix)s THEN 1.0 ELSE 0 END,
+           word_similarity(%(q)s, employee_name),
+           similarity(%(q)s, employee_number)
+       ) AS score
+FROM employee_department_view
+WHERE (%(q)s <%% employee_name OR employee_number %% %(q)s
+       OR employee_name ILIKE %(prefix)s OR employee_name ILIKE %(word_prefix)s
+       OR employee_number ILIKE %(prefix)s)
+"""
+
+# How long missing trigram indexes are remembered before checking the catalog again
+RECHECK_SECONDS = 60
+
+_WORD = re.compile(r"\w+")
+
+_lock = threading.Lock()
+_use_trgm = False
+_checked_at = None
+
+
+def trigrams(text):
+    """Split text into trigrams the way pg_trgm does: lowercased words padded with blanks"""
+    grams = set()
+    for word in _WORD.findall((text or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """
+    In-process fallback for deployments without pg_trgm.
+
+    Each employee is indexed under several entries (full name, each word of the
+    name, employee number) so a query can match any of them; a row scores the
+    best similarity of its entries.  Rows are kept in name order so equal
+    scores fall back to alphabetical order like the SQL version.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: (r["employee_name"] or "", r["employee_id"]))
+        self.departments = np.array([r["department_id"] or 0 for r in self.rows], dtype=np.int64)
+        self.statuses = np.array([r["employee_status"] or "" for r in self.rows], dtype=object)
+
+        entry_rows, entry_grams, postings, prefixes = [], [], {}, []
+        for i, row in enumerate(self.rows):
+            name = (row["employee_name"] or "").lower()
+            texts = {name, (row["employee_number"] or "").lower(), *_WORD.findall(name)}
+            for text in texts:
+                if not text:
+                    continue
+                entry = len(entry_rows)
+                grams = trigrams(text)
+                entry_rows.append(i)
+                entry_grams.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(entry)
+                prefixes.append((text, i))
+
+        self.entry_rows = np.array(entry_rows, dtype=np.int64)
+        self.entry_grams = np.array(entry_grams, dtype=np.int64)
+        self.postings = {g: np.array(ids, dtype=np.int64) for g, ids in postings.items()}
+        prefixes.sort()
+        self.prefix_keys = [key for key, _ in prefixes]
+        self.prefix_rows = np.array([i for _, i in prefixes], dtype=np.int64)
+        self.built_at = time.monotonic()
+
+    def _mask(self, rows, department_id, status):
+        keep = np.ones(len(rows), dtype=bool)
+        if department_id:
+            keep &= self.departments[rows] == department_id
+        if status:
+            keep &= self.statuses[rows] == status
+        return keep
+
+    def search(self, query, limit=10, department_id=None, status=None):
+        """Return the top rows with their scores, best first"""
+        q = query.lower().strip()
+
+        # Prefix matches on the name, a word of it, or the number score highest
+        start = bisect.bisect_left(self.prefix_keys, q)
+        end = bisect.bisect_left(self.prefix_keys, q + "\uffff")
+        rows = np.unique(self.prefix_rows[start:end])
+        rows = rows[self._mask(rows, department_id, status)]
+        scores = np.ones(len(rows))
+
+        # Fuzzy matches can at best tie with a prefix match, so skip them when enough rows already scored 1
+        query_grams = [g for g in trigrams(q) if g in self.postings]
+        if len(rows) < limit and query_grams:
+            entries, shared = np.unique(
+                np.concatenate([self.postings[g] for g in query_grams]), return_counts=True
+            )
+            similarity = shared / (len(trigrams(q)) + self.entry_grams[entries] - shared)
+            good = similarity >= SIMILARITY_THRESHOLD
+            fuzzy_rows = self.entry_rows[entries[good]]
+            keep = self._mask(fuzzy_rows, department_id, status)
+            rows = np.concatenate([rows, fuzzy_rows[keep]])
+            scores = np.concatenate([scores, similarity[good][keep]])
+
+        # Best score per row, then highest score first and name order among equals
+        order = np.lexsort((rows, -scores))
+        rows, scores = rows[order], scores[order]
+        _, first = np.unique(rows, return_index=True)
+        first.sort()
+        best = first[:limit]
+        return [dict(self.rows[rows[i]], score=round(float(scores[i]), 3)) for i in best]
+
+
+_index = None
+
+
+def create_indexes():
+    """Install pg_trgm and build the trigram indexes; run once by an administrator (python employee_search.py)"""
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    conn = db._connect()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for statement in TRGM_INDEXES:
+                cursor.execute(statement)
+    finally:
+        conn.close()
+
+
+def _trgm_available():
+    """
+    Return whether pg_trgm and its indexes are installed.
+
+    Searches never run DDL; without the indexes they use the in-process
+    index, and the catalog is checked again after RECHECK_SECONDS.
+    """
+    global _use_trgm, _checked_at
+    if _use_trgm:
+        return True
+    if _checked_at and time.monotonic() - _checked_at < RECHECK_SECONDS:
+        return False
+    installed = db.execute_query(TRGM_INSTALLED_QUERY, fetch_one=True)
+    _use_trgm = bool(installed and installed["present"] >= len(TRGM_INDEXES))
+    first_check, _checked_at = _checked_at is None, time.monotonic()
+    if not _use_trgm and first_check:
+        print("pg_trgm indexes are missing, using in-process employee search index; "
+              "run 'python employee_search.py' to create them", file=sys.stderr)
+    return _use_trgm
+
+
+def _local_index():
+    global _index
+    with _lock:
+        if _index is None or time.monotonic() - _index.built_at > SEARCH_INDEX_TTL_SECONDS:
+            rows = db.execute_query(f"SELECT {SEARCH_COLUMNS} FROM employee_department_view") or []
+            _index = TrigramIndex([dict(r) for r in rows])
+        return _index
+
+
+def search(query, limit=10, department_id=None, status=None):
+    """Return the top matches for a name or employee number, best first"""
+    if limit <= 0:
+        raise ValueError("limit must be greater than 0")
+    if not _trgm_available():
+        return _local_index().search(query, limit, department_id, status)
+
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    sql = TRGM_QUERY
+    params = {
+        "q": query,
+        "prefix": escaped + "%",
+        "word_prefix": "% " + escaped + "%",
+        "limit": limit,
+    }
+
+    if department_id:
+        sql += " AND department_id = %(department_id)s"
+        params["department_id"] = department_id
+
+    if status:
+        sql += " AND employee_status = %(status)s"
+        params["status"] = status
+
+    sql += " ORDER BY score DESC, employee_name LIMIT %(limit)s"
+
+    return [dict(r) for r in db.execute_query(sql, params) or []]
+
+
+if __name__ == "__main__":
+    create_indexes()
+    print("pg_trgm and employee search indexes are ready")
@@ -1,4 +1,4 @@
 #!/bin/bash
 
 # Install MCP and other dependencies
-pip install "mcp[cli]>=1.6.0" psycopg2-binary>=2.9.9 python-dotenv>=1.0.0
+pip install "mcp[cli]>=1.6.0" psycopg2-binary>=2.9.9 python-dotenv>=1.0.0 numpy>=1.24
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+import sys
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+import db
+import work_calendar
+
+# Every change to a balance is a signed delta posted to one bucket of the
+# ledger; leave_balances holds the running totals so lookups never scan history.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leave_ledger (
+    id SERIAL PRIMARY KEY,
+    employee_id INTEGER NOT NULL REFERENCES employees(id),
+    leave_type VARCHAR(50) NOT NULL,
+    year INTEGER NOT NULL,
+    bucket VARCHAR(20) NOT NULL,
+    days NUMERIC(6, 2) NOT NULL,
+    entry_type VARCHAR(20) NOT NULL,
+    leave_id INTEGER REFERENCES leaves(id),
+    remark TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_leave_ledger_balance
+    ON leave_ledger (employee_id, leave_type, year);
+
+CREATE TABLE IF NOT EXISTS leave_balances (
+    employee_id INTEGER NOT NULL REFERENCES employees(id),
+    leave_type VARCHAR(50) NOT NULL,
+    year INTEGER NOT NULL,
+    entitled NUMERIC(6, 2) NOT NULL DEFAULT 0,
+    pending NUMERIC(6, 2) NOT NULL DEFAULT 0,
+    used NUMERIC(6, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (employee_id, leave_type, year)
+);
+"""
+
+BUCKETS = ("entitled", "pending", "used")
+
+# Which balance bucket a leave request occupies in each status
+STATUS_BUCKETS = {"Pending": "pending", "Approved": "used", "Rejected": None}
+
+# How long a missing ledger is remembered before checking again for the migration
+RECHECK_SECONDS = 60
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+_checked_at = None
+
+
+def create_schema():
+    """Create the ledger tables; run once by an administrator (python leave_balance.py)"""
+    db.execute_query(SCHEMA)
+
+
+def ledger_enabled():
+    """
+    Return whether the ledger tables exist.
+
+    The server does not create them itself, so a database role without
+    CREATE rights keeps working; leave writes then skip the ledger.
+    """
+    global _schema_ready, _checked_at
+    if _schema_ready:
+        return True
+    with _schema_lock:
+        if _schema_ready or (_checked_at and time.monotonic() - _checked_at < RECHECK_SECONDS):
+            return _schema_ready
+        row = db.execute_query("""
+        SELECT to_regclass('leave_ledger') IS NOT NULL
+               AND to_regclass('leave_balances') IS NOT NULL AS ready
+        """, fetch_one=True)
+        _schema_ready = bool(row and row["ready"])
+        _checked_at = time.monotonic()
+        if not _schema_ready:
+            print("Leave ledger tables are missing; run 'python leave_balance.py' to create them. "
+                  "Leave requests are recorded without balance tracking.", file=sys.stderr)
+        return _schema_ready
+
+
+def post(cursor, employee_id, leave_type, year, bucket, days, entry_type, leave_id=None, remark=None):
+    """Append a ledger entry and apply it to the materialized balance in one statement"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown balance bucket: {bucket}")
+
+    cursor.execute(f"""
+    WITH entry AS (
+        INSERT INTO leave_ledger
+        (employee_id, leave_type, year, bucket, days, entry_type, leave_id, remark)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING employee_id, leave_type, year, days
+    )
+    INSERT INTO leave_balances (employee_id, leave_type, year, {bucket})
+    SELECT employee_id, leave_type, year, days FROM entry
+    ON CONFLICT (employee_id, leave_type, year) DO UPDATE
+    SET {bucket} = leave_balances.{bucket} + EXCLUDED.{bucket},
+        updated_at = CURRENT_TIMESTAMP
+    """, [employee_id, leave_type, year, bucket, days, entry_type, leave_id, remark])
+
+
+def split_by_year(start_date, end_date, days):
+    """
+    Share a leave's days out over the calendar years its range touches.
+
+    Each year gets a part in proportion to its working days in the range
+    (calendar days if there are none); the last year takes the rounding
+    remainder so the parts add up to the requested days.
+    """
+    days = Decimal(str(days))
+    if start_date.year == end_date.year:
+        return [(start_date.year, days)]
+
+    spans = [(year, max(start_date, date(year, 1, 1)), min(end_date, date(year, 12, 31)))
+             for year in range(start_date.year, end_date.year + 1)]
+    weights = [work_calendar.working_days_between(lo, hi) for _, lo, hi in spans]
+    if not any(weights):
+        weights = [(hi - lo).days + 1 for _, lo, hi in spans]
+
+    total = sum(weights)
+    parts, remainder = [], days
+    for (year, _, _), weight in zip(spans[:-1], weights):
+        share = (days * weight / total).quantize(Decimal("0.01"))
+        parts.append((year, share))
+        remainder -= share
+    parts.append((spans[-1][0], remainder))
+    return [(year, share) for year, share in parts if share]
+
+
+def submit(cursor, employee_id, leave_type, start_date, end_date, days, leave_id):
+    """Book a new leave request's days as pending, one Submitted entry per year it touches"""
+    for year, share in split_by_year(start_date, end_date, days):
+        post(cursor, employee_id, leave_type, year, "pending", share, "Submitted", leave_id=leave_id)
+
+
+def available(cursor, employee_id, leave_type, year):
+    """Return the remaining days, locking the balance row until the transaction ends"""
+    cursor.execute("""
+    SELECT entitled - used - pending AS available
+    FROM leave_balances
+    WHERE employee_id = %s AND leave_type = %s AND year = %s
+    FOR UPDATE
+    """, [employee_id, leave_type, year])
+    row = cursor.fetchone()
+    return float(row["available"]) if row else 0.0
+
+
+def apply_status_change(cursor, leave, old_status, new_status):
+    """
+    Move a leave request's days between buckets when its status changes.
+
+    The days move year by year as the Submitted entries booked them.
+    Requests without a Submitted entry (created before the ledger existed,
+    or by other writers) never reached the pending bucket and are left out.
+    """
+    old_bucket = STATUS_BUCKETS.get(old_status)
+    new_bucket = STATUS_BUCKETS.get(new_status)
+    if old_bucket == new_bucket:
+        return
+
+    cursor.execute("""
+    WITH booked AS (
+        SELECT year, SUM(days) AS days
+        FROM leave_ledger
+        WHERE leave_id = %(leave_id)s AND entry_type = 'Submitted'
+        GROUP BY year
+    ),
+    moves AS (
+        SELECT b.year, m.bucket, m.sign * b.days AS days
+        FROM booked b
+        CROSS JOIN (VALUES (%(old_bucket)s::varchar, -1), (%(new_bucket)s::varchar, 1)) m(bucket, sign)
+        WHERE m.bucket IS NOT NULL
+    ),
+    entries AS (
+        INSERT INTO leave_ledger
+        (employee_id, leave_type, year, bucket, days, entry_type, leave_id)
+        SELECT %(employee_id)s, %(leave_type)s, year, bucket, days, %(status)s, %(leave_id)s
+        FROM moves
+    )
+    INSERT INTO leave_balances (employee_id, leave_type, year, pending, used)
+    SELECT %(employee_id)s, %(leave_type)s, year,
+           SUM(CASE WHEN bucket = 'pending' THEN days ELSE 0 END),
+           SUM(CASE WHEN bucket = 'used' THEN days ELSE 0 END)
+    FROM moves
+    GROUP BY year
+    ON CONFLICT (employee_id, leave_type, year) DO UPDATE
+    SET pending = leave_balances.pending + EXCLUDED.pending,
+        used = leave_balances.used + EXCLUDED.used,
+        updated_at = CURRENT_TIMESTAMP
+    """, {"leave_id": leave["id"], "employee_id": leave["employee_id"],
+          "leave_type": leave["leave_type"], "status": new_status,
+          "old_bucket": old_bucket, "new_bucket": new_bucket})
+
+
+def apply_bulk_decision(cursor, leave_ids, new_status):
+    """
+    Move many pending leave requests with a Submitted ledger entry to their decided bucket.
+
+    As with apply_status_change, each year gets back the days its Submitted entries booked.
+    """
+    to_used = STATUS_BUCKETS.get(new_status) == "used"
+    cursor.execute("""
+    WITH moved AS (
+        SELECT leave_id AS id, employee_id, leave_type, year, SUM(days) AS duration
+        FROM leave_ledger
+        WHERE leave_id = ANY(%s) AND entry_type = 'Submitted'
+        GROUP BY leave_id, employee_id, leave_type, year
+    ),
+    entries AS (
+        INSERT INTO leave_ledger
+        (employee_id, leave_type, year, bucket, days, entry_type, leave_id)
+        SELECT employee_id, leave_type, year, 'pending', -duration, %s, id FROM moved
+        UNION ALL
+        SELECT employee_id, leave_type, year, 'used', duration, %s, id FROM moved WHERE %s
+    )
+    INSERT INTO leave_balances (employee_id, leave_type, year, pending, used)
+    SELECT employee_id, leave_type, year, -SUM(duration),
+           CASE WHEN %s THEN SUM(duration) ELSE 0 END
+    FROM moved
+    GROUP BY employee_id, leave_type, year
+    ON CONFLICT (employee_id, leave_type, year) DO UPDATE
+    SET pending = leave_balances.pending + EXCLUDED.pending,
+        used = leave_balances.used + EXCLUDED.used,
+        updated_at = CURRENT_TIMESTAMP
+    """, [list(leave_ids), new_status, new_status, to_used, to_used])
+
+
+def get_balances(employee_ids=None, department_id=None, year=None, leave_type=None):
+    """Look up materialized balances for a set of employees or a whole department"""
+    query = """
+    SELECT b.employee_id, e.employee_number, e.name AS employee_name,
+           b.leave_type, b.year, b.entitled, b.pending, b.used,
+           b.entitled - b.used - b.pending AS available
+    FROM leave_balances b
+    JOIN employees e ON b.employee_id = e.id
+    WHERE b.year = %s
+    """
+    params = [year]
+
+    if employee_ids:
+        query += " AND b.employee_id = ANY(%s)"
+        params.append(list(employee_ids))
+
+    if department_id:
+        query += " AND e.department_id = %s"
+        params.append(department_id)
+
+    if leave_type:
+        query += " AND b.leave_type = %s"
+        params.append(leave_type)
+
+    query += " ORDER BY e.name, b.leave_type"
+
+    return db.execute_query(query, params)
+
+
+if __name__ == "__main__":
+    create_schema()
+    print("Leave ledger tables are ready")
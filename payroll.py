@@ -0,0 +1,242 @@
+import csv
+import os
+import re
+from datetime import timedelta
+
+import numpy as np
+
+import db
+import work_calendar
+
+# Leave types that are deducted from pay; every other approved leave is paid
+UNPAID_LEAVE_TYPES = frozenset(
+    t.strip() for t in os.getenv("UNPAID_LEAVE_TYPES", "Unpaid").split(",") if t.strip()
+)
+# Dedicated directory for payroll files; nothing is written outside it
+PAYROLL_OUTPUT_DIR = os.getenv("PAYROLL_OUTPUT_DIR", "payroll_output")
+# File names a caller may choose: one path component ending in .csv
+OUTPUT_NAME = re.compile(r"[\w-][\w.-]*\.csv")
+
+METRICS = (
+    "worked_hours",
+    "late_minutes",
+    "early_leave_minutes",
+    "overtime_hours",
+    "paid_leave_days",
+    "unpaid_leave_days",
+)
+
+
+def fetch_month(year, month, department_id=None):
+    """
+    Load everything payroll needs for a month in one columnar query per table.
+
+    Dates come back as day offsets into the month and times as minutes after
+    midnight of the record date, so the result maps straight onto arrays.
+    """
+    first, last = work_calendar.month_bounds(year, month)
+    dept_filter = " AND e.department_id = %s" if department_id else ""
+    dept_params = [department_id] if department_id else []
+
+    employees = db.execute_columnar(f"""
+    SELECT e.id AS employee_id, e.employee_number, e.name AS employee_name
+    FROM employees e
+    WHERE 1=1{dept_filter}
+    ORDER BY e.id
+    """, dept_params)
+
+    attendance = db.execute_columnar(f"""
+    SELECT a.employee_id, a.record_date - %s::date AS day,
+           EXTRACT(EPOCH FROM a.clock_in_time - a.record_date::timestamp) / 60 AS clock_in_min,
+           EXTRACT(EPOCH FROM a.clock_out_time - a.record_date::timestamp) / 60 AS clock_out_min
+    FROM attendance_records a
+    JOIN employees e ON a.employee_id = e.id
+    WHERE a.record_date BETWEEN %s AND %s{dept_filter}
+    """, [first, first, last] + dept_params)
+
+    schedules = db.execute_columnar(f"""
+    SELECT s.employee_id,
+           GREATEST(s.start_date, %s::date) - %s::date AS first_day,
+           LEAST(s.end_date, %s::date) - %s::date AS last_day,
+           EXTRACT(EPOCH FROM sh.start_time) / 60 AS start_min,
+           EXTRACT(EPOCH FROM sh.end_time) / 60
+               + CASE WHEN sh.is_night_shift OR sh.end_time <= sh.start_time THEN 1440 ELSE 0 END
+               AS end_min
+    FROM schedules s
+    JOIN shifts sh ON s.shift_id = sh.id
+    JOIN employees e ON s.employee_id = e.id
+    WHERE s.start_date <= %s AND s.end_date >= %s{dept_filter}
+    """, [first, first, last, first, last, first] + dept_params)
+
+    overtimes = db.execute_columnar(f"""
+    SELECT o.employee_id, o.hours
+    FROM overtimes o
+    JOIN employees e ON o.employee_id = e.id
+    WHERE o.status = 'Approved' AND o.overtime_date BETWEEN %s AND %s{dept_filter}
+    """, [first, last] + dept_params)
+
+    leaves = db.execute_columnar(f"""
+    SELECT l.employee_id,
+           GREATEST(l.start_date, %s::date) - %s::date AS first_day,
+           LEAST(l.end_date, %s::date) - %s::date AS last_day,
+           l.leave_type
+    FROM leaves l
+    JOIN employees e ON l.employee_id = e.id
+    WHERE l.status = 'Approved' AND l.start_date <= %s AND l.end_date >= %s{dept_filter}
+    """, [first, first, last, first, last, first] + dept_params)
+
+    days = (last - first).days + 1
+    working = np.array(
+        [work_calendar.is_working_day(first + timedelta(days=i)) for i in range(days)],
+        dtype=bool,
+    )
+
+    return {
+        "employees": employees,
+        "attendance": attendance,
+        "schedules": schedules,
+        "overtimes": overtimes,
+        "leaves": leaves,
+        "working": working,
+    }
+
+
+def _rows(employee_ids, column):
+    """Map employee IDs to row numbers; unknown IDs map to -1"""
+    ids = np.asarray(column, dtype=np.int64)
+    rows = np.searchsorted(employee_ids, ids)
+    rows = np.minimum(rows, len(employee_ids) - 1)
+    return np.where(employee_ids[rows] == ids, rows, -1) if len(ids) else rows
+
+
+def _expand_ranges(rows, first_day, last_day):
+    """Expand inclusive day ranges into flat (row, day) index arrays plus range lengths"""
+    lengths = np.maximum(last_day - first_day + 1, 0)
+    flat_rows = np.repeat(rows, lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return flat_rows, np.repeat(first_day, lengths) + offsets, lengths
+
+
+def compute(data):
+    """
+    Compute every payroll metric for the whole workforce in one vectorized pass.
+
+    Attendance and shift times are laid out as (employee, day) arrays; missing
+    values are NaN and drop out of the sums.
+    """
+    working = data["working"]
+    days = len(working)
+    employee_ids = np.asarray(data["employees"]["employee_id"], dtype=np.int64)
+    count = len(employee_ids)
+    if count == 0:
+        return {"employees": data["employees"], **{m: np.zeros(0) for m in METRICS}}
+
+    # Attendance grid
+    clock_in = np.full((count, days), np.nan)
+    clock_out = np.full((count, days), np.nan)
+    att = data["attendance"]
+    rows = _rows(employee_ids, att["employee_id"])
+    day = np.asarray(att["day"], dtype=np.int64)
+    keep = rows >= 0
+    clock_in[rows[keep], day[keep]] = np.asarray(att["clock_in_min"], dtype=float)[keep]
+    clock_out[rows[keep], day[keep]] = np.asarray(att["clock_out_min"], dtype=float)[keep]
+
+    # Scheduled shift grid
+    shift_start = np.full((count, days), np.nan)
+    shift_end = np.full((count, days), np.nan)
+    sch = data["schedules"]
+    rows = _rows(employee_ids, sch["employee_id"])
+    keep = rows >= 0
+    flat_rows, flat_days, lengths = _expand_ranges(
+        rows[keep],
+        np.asarray(sch["first_day"], dtype=np.int64)[keep],
+        np.asarray(sch["last_day"], dtype=np.int64)[keep],
+    )
+    shift_start[flat_rows, flat_days] = np.repeat(np.asarray(sch["start_min"], dtype=float)[keep], lengths)
+    shift_end[flat_rows, flat_days] = np.repeat(np.asarray(sch["end_min"], dtype=float)[keep], lengths)
+
+    worked = clock_out - clock_in
+    late = np.clip(clock_in - shift_start, 0, None)
+    early = np.clip(shift_end - clock_out, 0, None)
+
+    # Approved overtime hours
+    ot = data["overtimes"]
+    rows = _rows(employee_ids, ot["employee_id"])
+    keep = rows >= 0
+    overtime = np.bincount(
+        rows[keep], weights=np.asarray(ot["hours"], dtype=float)[keep], minlength=count
+    )
+
+    # Leave days that fall on working days, split by paid/unpaid leave type
+    lv = data["leaves"]
+    rows = _rows(employee_ids, lv["employee_id"])
+    unpaid = np.array([t in UNPAID_LEAVE_TYPES for t in lv["leave_type"]], dtype=bool)
+    leave_days = {}
+    for name, mask in (("paid_leave_days", ~unpaid), ("unpaid_leave_days", unpaid)):
+        keep = (rows >= 0) & mask
+        on_leave = np.zeros((count, days), dtype=bool)
+        flat_rows, flat_days, _ = _expand_ranges(
+            rows[keep],
+            np.asarray(lv["first_day"], dtype=np.int64)[keep],
+            np.asarray(lv["last_day"], dtype=np.int64)[keep],
+        )
+        on_leave[flat_rows, flat_days] = True
+        leave_days[name] = (on_leave & working).sum(axis=1)
+
+    return {
+        "employees": data["employees"],
+        "worked_hours": np.nansum(np.clip(worked, 0, None), axis=1) / 60,
+        "late_minutes": np.nansum(late, axis=1),
+        "early_leave_minutes": np.nansum(early, axis=1),
+        "overtime_hours": overtime,
+        **leave_days,
+    }
+
+
+def write_csv(result, path):
+    """Write one row per employee with all payroll metrics"""
+    employees = result["employees"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["employee_id", "employee_number", "employee_name", *METRICS])
+        for i, employee_id in enumerate(employees["employee_id"]):
+            writer.writerow([
+                employee_id,
+                employees["employee_number"][i],
+                employees["employee_name"][i],
+                *(round(float(result[m][i]), 2) for m in METRICS),
+            ])
+
+
+def output_file(name, year, month, department_id=None):
+    """
+    Return the path to write a payroll file to, inside PAYROLL_OUTPUT_DIR.
+
+    Raises ValueError unless name is a plain file name ending in .csv.
+    """
+    if not name:
+        suffix = f"_dept{department_id}" if department_id else ""
+        name = f"payroll_{year}_{month:02d}{suffix}.csv"
+    elif not OUTPUT_NAME.fullmatch(name):
+        raise ValueError("Output file must be a plain file name ending in .csv, without directories")
+
+    directory = os.path.realpath(PAYROLL_OUTPUT_DIR)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.realpath(os.path.join(directory, name))
+    # A symlink planted in the directory must not lead the write elsewhere
+    if os.path.dirname(path) != directory:
+        raise ValueError("Output file must be inside PAYROLL_OUTPUT_DIR")
+    return path
+
+
+def run(year, month, department_id=None, output_path=None):
+    """Fetch, compute and write a month's payroll attendance; return a summary"""
+    output_path = output_file(output_path, year, month, department_id)
+    result = compute(fetch_month(year, month, department_id))
+    write_csv(result, output_path)
+
+    return {
+        "output_path": output_path,
+        "employee_count": len(result["employees"]["employee_id"]),
+        "totals": {m: round(float(result[m].sum()), 2) for m in METRICS},
+    }
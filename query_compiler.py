@@ -0,0 +1,213 @@
+from functools import lru_cache
+
+# SQL for each operator; every one takes exactly one parameter so the
+# statement text depends only on which filters are present.
+OPERATORS = {
+    "eq": "{column} = ANY(%s)",
+    "gte": "{column} >= %s",
+    "lte": "{column} <= %s",
+    "prefix": "{column} LIKE %s",
+    # The column is a complete condition with one %s receiving a list
+    "sql": "{column}",
+}
+
+
+class View:
+    """
+    Declarative description of a filterable read query.
+
+    filters maps a tool argument name to (column or expression, operator).
+    Filters are always emitted in declaration order, so one filter shape
+    always produces the same SQL text.  order_by ends with a unique key so
+    pages read with OFFSET neither repeat nor skip rows.  summary optionally names the
+    (status, date) columns aggregated when a result is too large to return.
+    """
+
+    def __init__(self, name, select, source, filters, order_by, summary=None):
+        self.name = name
+        self.select = select
+        self.source = source
+        self.filters = filters
+        self.order_by = order_by
+        self.summary = summary
+
+    def _filter_params(self, values):
+        present = tuple(name for name in self.filters if _present(values.get(name)))
+        unknown = set(values) - set(self.filters)
+        if unknown:
+            raise ValueError(f"Unknown filters for {self.name}: {', '.join(sorted(unknown))}")
+        return present, [_param(self.filters[name][1], values[name]) for name in present]
+
+    def compile(self, offset=None, **values):
+        """Return (sql, params) for the filters given a value; None, 0, empty strings and empty lists are ignored"""
+        present, params = self._filter_params(values)
+        sql = _compile(self, present, bool(offset), False)
+        if offset:
+            params.append(offset)
+        return sql, params
+
+    def compile_summary(self, **values):
+        """Return (sql, params) counting matching rows per status with their date span"""
+        if not self.summary:
+            raise ValueError(f"View {self.name} has no summary columns")
+        present, params = self._filter_params(values)
+        return _compile(self, present, False, True), params
+
+
+def _present(value):
+    # As the hand-written queries did, a falsy value such as None, 0, "" or an
+    # empty list means the filter was not given; only False is a real value
+    if isinstance(value, bool):
+        return True
+    if isinstance(value, (list, tuple)):
+        return len(value) > 0
+    return bool(value)
+
+
+def _param(operator, value):
+    if operator in ("eq", "sql"):
+        return list(value) if isinstance(value, (list, tuple)) else [value]
+    if operator == "prefix":
+        escaped = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return escaped + "%"
+    return value
+
+
+@lru_cache(maxsize=1024)
+def _compile(view, present, offset, summary):
+    """Build the SQL text for one filter shape of a view; cached per shape"""
+    if summary:
+        status, day = view.summary
+        sql = (f"SELECT {status} AS status, COUNT(*) AS count, "
+               f"MIN({day}) AS first_date, MAX({day}) AS last_date FROM {view.source}")
+    else:
+        sql = f"SELECT {view.select} FROM {view.source}"
+    conditions = [
+        OPERATORS[view.filters[name][1]].format(column=view.filters[name][0])
+        for name in present
+    ]
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if summary:
+        return sql + f" GROUP BY {status} ORDER BY {status}"
+    if view.order_by:
+        sql += f" ORDER BY {view.order_by}"
+    if offset:
+        sql += " OFFSET %s"
+    return sql
+
+
+# ==================== Views ====================
+
+EMPLOYEES = View(
+    "employees",
+    "*",
+    "employee_department_view",
+    {
+        "employee_id": ("employee_id", "eq"),
+        "employee_number": ("employee_number", "eq"),
+        "department_id": ("department_id", "eq"),
+        "status": ("employee_status", "eq"),
+        "name_prefix": ("employee_name", "prefix"),
+    },
+    "dept_name, employee_name, employee_id",
+)
+
+EMPLOYEE_LIST = View(
+    "employee_list",
+    "employee_id, employee_number, employee_name, position, dept_name, hire_date, employee_status",
+    EMPLOYEES.source,
+    EMPLOYEES.filters,
+    EMPLOYEES.order_by,
+    summary=("employee_status", "hire_date"),
+)
+
+ATTENDANCE = View(
+    "attendance",
+    "*",
+    "attendance_detail_view",
+    {
+        "employee_id": ("employee_id", "eq"),
+        "employee_number": ("employee_number", "eq"),
+        "start_date": ("record_date", "gte"),
+        "end_date": ("record_date", "lte"),
+        "status": ("attendance_status", "eq"),
+    },
+    "record_date DESC, employee_name, employee_id",
+    summary=("attendance_status", "record_date"),
+)
+
+LEAVES = View(
+    "leaves",
+    "*",
+    "leave_detail_view",
+    {
+        "employee_id": ("employee_id", "eq"),
+        "employee_number": ("employee_number", "eq"),
+        "start_date": ("start_date", "gte"),
+        "end_date": ("end_date", "lte"),
+        "status": ("leave_status", "eq"),
+        "leave_type": ("leave_type", "eq"),
+    },
+    "start_date DESC, employee_name, id",
+    summary=("leave_status", "start_date"),
+)
+
+OVERTIMES = View(
+    "overtimes",
+    "*",
+    "overtime_detail_view",
+    {
+        "employee_id": ("employee_id", "eq"),
+        "employee_number": ("employee_number", "eq"),
+        "start_date": ("overtime_date", "gte"),
+        "end_date": ("overtime_date", "lte"),
+        "status": ("overtime_status", "eq"),
+    },
+    "overtime_date DESC, employee_name, id",
+    summary=("overtime_status", "overtime_date"),
+)
+
+SCHEDULES = View(
+    "schedules",
+    """s.id as schedule_id, e.id as employee_id, e.employee_number, e.name as employee_name,
+    s.start_date, s.end_date, sh.id as shift_id, sh.shift_name,
+    sh.start_time, sh.end_time, sh.is_night_shift""",
+    """schedules s
+    JOIN employees e ON s.employee_id = e.id
+    JOIN shifts sh ON s.shift_id = sh.id""",
+    {
+        "employee_id": ("e.id", "eq"),
+        "employee_number": ("e.employee_number", "eq"),
+        "start_date": ("s.start_date", "gte"),
+        "end_date": ("s.end_date", "lte"),
+    },
+    "s.start_date, e.name, s.id",
+)
+
+MONTHLY_STATS = View(
+    "monthly_stats",
+    "*",
+    "monthly_attendance_stats",
+    {
+        "year": ("year", "eq"),
+        "month": ("month", "eq"),
+        "department_id": (
+            "employee_id IN (SELECT id FROM employees WHERE department_id = ANY(%s))", "sql"
+        ),
+        "employee_id": ("employee_id", "eq"),
+    },
+    "dept_name, employee_name, employee_id, year, month",
+)
+
+HOLIDAYS = View(
+    "holidays",
+    "id, holiday_name, holiday_date, is_paid",
+    "holidays",
+    {
+        "year": ("EXTRACT(YEAR FROM holiday_date)", "eq"),
+        "month": ("EXTRACT(MONTH FROM holiday_date)", "eq"),
+        "is_paid": ("is_paid", "eq"),
+    },
+    "holiday_date, id",
+)
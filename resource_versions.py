@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+# Number of serialized resource payloads kept in memory
+RESOURCE_CACHE_SIZE = int(os.getenv("RESOURCE_CACHE_SIZE", "1024"))
+# How long a missing member counter is remembered before checking again for the migration
+RECHECK_SECONDS = 60
+
+# A department's version must change when employees join or leave it.  A
+# counter per department, bumped by a trigger, lets the version lookup read
+# one row instead of counting the department's employees.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS department_member_versions (
+    department_id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION bump_department_member_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.department_id IS NOT DISTINCT FROM NEW.department_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.department_id IS NOT NULL THEN
+        INSERT INTO department_member_versions (department_id, version) VALUES (OLD.department_id, 1)
+        ON CONFLICT (department_id) DO UPDATE SET version = department_member_versions.version + 1;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.department_id IS NOT NULL THEN
+        INSERT INTO department_member_versions (department_id, version) VALUES (NEW.department_id, 1)
+        ON CONFLICT (department_id) DO UPDATE SET version = department_member_versions.version + 1;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS employees_department_member_version ON employees;
+CREATE TRIGGER employees_department_member_version
+AFTER INSERT OR DELETE OR UPDATE OF department_id ON employees
+FOR EACH ROW EXECUTE FUNCTION bump_department_member_version();
+"""
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # uri -> (version, payload), least recently used first
+
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+_checked_at = None
+
+
+def create_schema():
+    """Create the member counter and its trigger; run once by an administrator (python resource_versions.py)"""
+    db.execute_query(SCHEMA)
+
+
+def member_versions_ready():
+    """Return whether the department member counter exists; the server does not create it itself"""
+    global _schema_ready, _checked_at
+    if _schema_ready:
+        return True
+    with _schema_lock:
+        if _schema_ready or (_checked_at and time.monotonic() - _checked_at < RECHECK_SECONDS):
+            return _schema_ready
+        row = db.execute_query("""
+        SELECT to_regclass('department_member_versions') IS NOT NULL
+               AND EXISTS (SELECT 1 FROM pg_trigger
+                           WHERE tgname = 'employees_department_member_version') AS ready
+        """, fetch_one=True)
+        _schema_ready = bool(row and row["ready"])
+        _checked_at = time.monotonic()
+        return _schema_ready
+
+
+def _cached(uri):
+    with _lock:
+        entry = _cache.get(uri)
+        if entry:
+            _cache.move_to_end(uri)
+        return entry
+
+
+def _store(uri, version, payload):
+    with _lock:
+        _cache[uri] = (version, payload)
+        _cache.move_to_end(uri)
+        while len(_cache) > RESOURCE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _forget(uri):
+    with _lock:
+        _cache.pop(uri, None)
+
+
+def read(uri, params, version_statement, full_statement, not_found, if_none_match=None):
+    """
+    Return a resource payload, or a short "unchanged" answer when if_none_match is current.
+
+    version_statement is a registered statement returning only the version
+    of the resource's rows; full_statement returns the payload columns and
+    the same version.  The version lookup is used whenever it can save the
+    full read: the client already has a version, or a payload is cached.
+    """
+    cached = _cached(uri)
+    if if_none_match or cached:
+        row = db.execute_prepared(version_statement, params, fetch_one=True)
+        if not row:
+            _forget(uri)
+            return not_found
+        version = str(row["version"])
+        if version == if_none_match:
+            return json.dumps({"version": version, "unchanged": True}, indent=2)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    row = db.execute_prepared(full_statement, params, fetch_one=True)
+    if not row:
+        _forget(uri)
+        return not_found
+
+    row = dict(row, version=str(row["version"]))
+    payload = json.dumps(row, indent=2, default=str)
+    _store(uri, row["version"], payload)
+    return payload
+
+
+if __name__ == "__main__":
+    create_schema()
+    print("Department member version counter is ready")
@@ -0,0 +1,87 @@
+import base64
+import hashlib
+import json
+import os
+from contextlib import closing
+
+import db
+
+# Largest JSON response a list tool returns before it summarises instead
+MAX_RESPONSE_BYTES = int(os.getenv("MAX_RESPONSE_BYTES", "200000"))
+# Rows fetched from the server per round trip while filling the budget
+FETCH_BATCH_ROWS = 100
+# Room kept in the budget for the envelope around the rows: offset, summary and token
+ENVELOPE_BYTES = 512
+
+
+def _fingerprint(view, values):
+    text = json.dumps([view.name, values], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def encode_token(view, values, offset):
+    """Build a continuation token for the rows of a filtered view after offset"""
+    payload = json.dumps({"o": offset, "f": _fingerprint(view, values)})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_token(token, view, values):
+    """Return the offset in a continuation token, checking it was issued for the same filters"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        offset, fingerprint = int(payload["o"]), payload["f"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid continuation token")
+    if fingerprint != _fingerprint(view, values) or offset < 0:
+        raise ValueError("Continuation token does not match these filters")
+    return offset
+
+
+def _summary(view, values):
+    query, params = view.compile_summary(**values)
+    rows = db.execute_query(query, params) or []
+    dates = [d for r in rows for d in (r["first_date"], r["last_date"]) if d is not None]
+    return {
+        "total": sum(r["count"] for r in rows),
+        "by_status": {str(r["status"]): r["count"] for r in rows},
+        "first_date": min(dates) if dates else None,
+        "last_date": max(dates) if dates else None,
+    }
+
+
+def fetch(view, max_response_bytes=None, continuation=None, **values):
+    """
+    Return the JSON for a filtered view, or None when no rows match.
+
+    Every response has the same shape: rows, offset, returned, summary and
+    continuation.  Rows are streamed from the database until the byte
+    budget is full.  When more rows match, the first page's summary
+    describes all matching rows and continuation holds the token for the
+    next page; otherwise both are null.
+    """
+    budget = max_response_bytes or MAX_RESPONSE_BYTES
+    offset = decode_token(continuation, view, values) if continuation else 0
+
+    query, params = view.compile(offset=offset, **values)
+    # Serialized one row at a time, indented as json.dumps would inside the envelope
+    rows, used, truncated = [], ENVELOPE_BYTES, False
+    with closing(db.iter_query(query, params, FETCH_BATCH_ROWS)) as stream:
+        for row in stream:
+            size = len(json.dumps(dict(row), indent=2, default=str).replace("\n", "\n    ")) + 6
+            if rows and used + size > budget:
+                truncated = True
+                break
+            rows.append(dict(row))
+            used += size
+    if not rows:
+        return None
+
+    response = {
+        "rows": rows,
+        "offset": offset,
+        "returned": len(rows),
+        # Later pages skip the aggregate; the first page already described the whole result
+        "summary": _summary(view, values) if truncated and not offset else None,
+        "continuation": encode_token(view, values, offset + len(rows)) if truncated else None,
+    }
+    return json.dumps(response, indent=2, default=str)
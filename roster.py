@@ -0,0 +1,254 @@
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import db
+
+# How long the in-memory roster is trusted before it is reloaded, to pick up
+# schedules written by other processes
+ROSTER_TTL_SECONDS = float(os.getenv("ROSTER_TTL_SECONDS", "300"))
+# Newly assigned schedules are kept in a small unsorted list until there are
+# this many, then folded into the tree in one rebuild
+REBUILD_THRESHOLD = 256
+# Expanded days and coverage edges kept between rebuilds, least recently used dropped first
+DAY_CACHE_SIZE = 400
+
+ROSTER_QUERY = """
+SELECT s.id AS schedule_id, s.employee_id, e.employee_number, e.name AS employee_name,
+       e.department_id, s.start_date, s.end_date, sh.id AS shift_id, sh.shift_name,
+       sh.start_time, sh.end_time, sh.is_night_shift
+FROM schedules s
+JOIN employees e ON s.employee_id = e.id
+JOIN shifts sh ON s.shift_id = sh.id
+"""
+
+
+class IntervalTree:
+    """Static centered interval tree over inclusive (start, end, item) triples"""
+
+    def __init__(self, intervals):
+        self.center = None
+        self.left = self.right = None
+        if not intervals:
+            return
+
+        points = sorted(p for start, end, _ in intervals for p in (start, end))
+        self.center = points[len(points) // 2]
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+
+        self.by_start = sorted(here, key=lambda i: i[0])
+        self.by_end = sorted(here, key=lambda i: i[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def stab(self, point):
+        """Return the items of all intervals containing point"""
+        found = []
+        node = self
+        while node is not None and node.center is not None:
+            if point < node.center:
+                for start, _, item in node.by_start:
+                    if start > point:
+                        break
+                    found.append(item)
+                node = node.left
+            elif point > node.center:
+                for _, end, item in node.by_end:
+                    if end < point:
+                        break
+                    found.append(item)
+                node = node.right
+            else:
+                found.extend(item for _, _, item in node.by_start)
+                break
+        return found
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _shift_window(row):
+    """Return the shift's (start, end) in minutes after midnight of its start day"""
+    start = _minutes(row["start_time"])
+    end = _minutes(row["end_time"])
+    if row["is_night_shift"] or end <= start:
+        end += 1440
+    return start, end
+
+
+class Roster:
+    """In-memory index of schedules joined with shifts, expanded to days on demand"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = None
+        self._tree = None
+        self._delta = []
+        self._days = OrderedDict()
+        self._generation = 0
+        self._loaded_at = 0.0
+
+    def _ensure_loaded(self):
+        if self._rows is None or time.monotonic() - self._loaded_at > ROSTER_TTL_SECONDS:
+            rows = db.execute_query(ROSTER_QUERY) or []
+            self._rows = {row["schedule_id"]: dict(row) for row in rows}
+            self._rebuild()
+            self._loaded_at = time.monotonic()
+
+    def _rebuild(self):
+        self._tree = IntervalTree([
+            (row["start_date"].toordinal(), row["end_date"].toordinal(), row)
+            for row in self._rows.values()
+        ])
+        self._delta = []
+        self._clear_days()
+
+    def _clear_days(self):
+        self._days.clear()
+        self._generation += 1
+
+    def _cached(self, key):
+        value = self._days.get(key)
+        if value is not None:
+            self._days.move_to_end(key)
+        return value
+
+    def _cache(self, key, value, generation=None):
+        # A value computed before the index changed is not stored
+        if generation is not None and generation != self._generation:
+            return
+        self._days[key] = value
+        if len(self._days) > DAY_CACHE_SIZE:
+            self._days.popitem(last=False)
+
+    def invalidate(self):
+        """Drop the index so the next query reloads every schedule"""
+        with self._lock:
+            self._rows = None
+
+    def add_schedule(self, schedule_id):
+        """Index one newly written schedule without reloading the rest"""
+        # Nothing to update until the roster is loaded, which will include the schedule
+        if self._rows is None:
+            return
+        row = db.execute_query(ROSTER_QUERY + " WHERE s.id = %s", [schedule_id], fetch_one=True)
+        if not row:
+            return
+        with self._lock:
+            if self._rows is None:
+                return
+            row = dict(row)
+            self._rows[row["schedule_id"]] = row
+            self._delta.append(row)
+            self._clear_days()
+            if len(self._delta) >= REBUILD_THRESHOLD:
+                self._rebuild()
+
+    def scheduled_on(self, day, department_id=None):
+        """Return the schedule rows covering a day, optionally for one department"""
+        with self._lock:
+            self._ensure_loaded()
+            ordinal = day.toordinal()
+            rows = self._cached(ordinal)
+            if rows is None:
+                rows = self._tree.stab(ordinal)
+                rows += [r for r in self._delta
+                         if r["start_date"].toordinal() <= ordinal <= r["end_date"].toordinal()]
+                self._cache(ordinal, rows)
+        if department_id:
+            return [r for r in rows if r["department_id"] == department_id]
+        return list(rows)
+
+    def on_shift_at(self, moment, department_id=None):
+        """Return the schedule rows whose shift is running at a moment, including night shifts from the day before"""
+        minute = _minutes(moment)
+        found = []
+        for offset, day in ((0, moment.date()), (1440, moment.date() - timedelta(days=1))):
+            for row in self.scheduled_on(day, department_id):
+                start, end = _shift_window(row)
+                if start <= minute + offset < end:
+                    found.append(row)
+        return found
+
+    def _coverage_edges(self, day, department_id):
+        """Return sorted start and end minutes, within the day, of the shifts running on it"""
+        key = ("coverage", day.toordinal(), department_id)
+        with self._lock:
+            edges = self._cached(key)
+            generation = self._generation
+        if edges is not None:
+            return edges
+
+        starts, ends = [], []
+        for offset, source in ((0, day), (-1440, day - timedelta(days=1))):
+            for row in self.scheduled_on(source, department_id):
+                start, end = _shift_window(row)
+                start, end = max(start + offset, 0), min(end + offset, 1440)
+                if start < end:
+                    starts.append(start)
+                    ends.append(end)
+        edges = (sorted(starts), sorted(ends))
+        with self._lock:
+            self._cache(key, edges, generation)
+        return edges
+
+    def hourly_coverage(self, day, department_id=None):
+        """
+        Count how many people are on shift during each hour of a day.
+
+        Shifts overlapping an hour are those starting before it ends, less
+        those that ended before it started, so each hour takes two binary
+        searches over the day's cached shift edges.
+        """
+        starts, ends = self._coverage_edges(day, department_id)
+        return [
+            bisect.bisect_left(starts, (hour + 1) * 60) - bisect.bisect_right(ends, hour * 60)
+            for hour in range(24)
+        ]
+
+
+roster = Roster()
+
+
+def _to_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def roster_for_range(start_date, end_date=None, department_id=None, hourly=False):
+    """Expand the roster for each day of a date range"""
+    start = _to_date(start_date)
+    end = _to_date(end_date) if end_date else start
+    days = []
+    day = start
+    while day <= end:
+        rows = roster.scheduled_on(day, department_id)
+        entry = {
+            "date": day,
+            "scheduled": [{
+                "employee_id": r["employee_id"],
+                "employee_number": r["employee_number"],
+                "employee_name": r["employee_name"],
+                "shift_name": r["shift_name"],
+                "start_time": r["start_time"],
+                "end_time": r["end_time"],
+                "is_night_shift": r["is_night_shift"],
+            } for r in sorted(rows, key=lambda r: (r["start_time"], r["employee_name"]))],
+        }
+        if hourly:
+            entry["hourly_coverage"] = roster.hourly_coverage(day, department_id)
+        days.append(entry)
+        day += timedelta(days=1)
+    return days
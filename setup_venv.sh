@@ -7,7 +7,7 @@ python -m venv .venv
 source .venv/bin/activate
 
 # Install the required packages
-pip install "mcp[cli]>=1.6.0" psycopg2-binary>=2.9.9 python-dotenv>=1.0.0
+pip install "mcp[cli]>=1.6.0" psycopg2-binary>=2.9.9 python-dotenv>=1.0.0 numpy>=1.24
 
 # Verify the installation
 python -c "import mcp; print(f'MCP version: {mcp.__version__}')"
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+import db
+
+# Local copy of the reporting tables, so heavy analytics run without touching Postgres
+SNAPSHOT_PATH = os.getenv("ANALYTICS_SNAPSHOT_PATH", "attendance_snapshot.db")
+# Rows updated within this many seconds of the newest copied row are copied again
+# on the next sync, so a transaction that committed late with an older updated_at
+# is not skipped.
+WATERMARK_LAG_SECONDS = int(os.getenv("SNAPSHOT_WATERMARK_LAG_SECONDS", "60"))
+
+TABLES = ("departments", "employees", "schedules", "attendance_records", "leaves", "overtimes")
+
+# Canned aggregates over the snapshot; named parameters come from the report call
+REPORTS = {
+    "monthly_trend": """
+    SELECT substr(record_date, 1, 7) AS month, status, COUNT(*) AS records
+    FROM attendance_records
+    WHERE substr(record_date, 1, 4) = :year
+    GROUP BY month, status
+    ORDER BY month, status
+    """,
+    "department_comparison": """
+    SELECT d.id AS department_id, d.dept_name,
+           COUNT(DISTINCT e.id) AS employees,
+           (SELECT COUNT(*) FROM attendance_records a JOIN employees x ON a.employee_id = x.id
+            WHERE x.department_id = d.id AND a.record_date BETWEEN :start_date AND :end_date) AS attendance_days,
+           (SELECT COUNT(*) FROM attendance_records a JOIN employees x ON a.employee_id = x.id
+            WHERE x.department_id = d.id AND a.status = 'Late'
+              AND a.record_date BETWEEN :start_date AND :end_date) AS late_days,
+           (SELECT COALESCE(SUM(l.duration), 0) FROM leaves l JOIN employees x ON l.employee_id = x.id
+            WHERE x.department_id = d.id AND l.status = 'Approved'
+              AND l.start_date BETWEEN :start_date AND :end_date) AS leave_days,
+           (SELECT COALESCE(SUM(o.hours), 0) FROM overtimes o JOIN employees x ON o.employee_id = x.id
+            WHERE x.department_id = d.id AND o.status = 'Approved'
+              AND o.overtime_date BETWEEN :start_date AND :end_date) AS overtime_hours
+    FROM departments d
+    LEFT JOIN employees e ON e.department_id = d.id
+    GROUP BY d.id, d.dept_name
+    ORDER BY d.dept_name
+    """,
+    "leave_by_type": """
+    SELECT leave_type, status, COUNT(*) AS requests, SUM(duration) AS days
+    FROM leaves
+    WHERE start_date BETWEEN :start_date AND :end_date
+    GROUP BY leave_type, status
+    ORDER BY leave_type, status
+    """,
+    "overtime_by_month": """
+    SELECT substr(overtime_date, 1, 7) AS month, COUNT(*) AS requests, SUM(hours) AS hours
+    FROM overtimes
+    WHERE status = 'Approved' AND substr(overtime_date, 1, 4) = :year
+    GROUP BY month
+    ORDER BY month
+    """,
+}
+
+
+def _local_value(value):
+    """Convert driver values to types SQLite stores and compares consistently"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, dt_time)):
+        return value.isoformat()
+    return value
+
+
+def _connect(read_only=False):
+    if read_only:
+        if not os.path.exists(SNAPSHOT_PATH):
+            raise FileNotFoundError(
+                f"No analytics snapshot at {SNAPSHOT_PATH}; run sync_analytics_snapshot first"
+            )
+        return sqlite3.connect(f"file:{SNAPSHOT_PATH}?mode=ro", uri=True)
+    conn = sqlite3.connect(SNAPSHOT_PATH)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS _sync_state (
+        table_name TEXT PRIMARY KEY,
+        watermark TEXT,
+        rows INTEGER,
+        synced_at REAL
+    )
+    """)
+    return conn
+
+
+def sync(full=False):
+    """
+    Copy new and changed rows of the reporting tables into the local snapshot.
+
+    Tables with an updated_at column are copied incrementally from the last
+    watermark; the rest, and every table when full is set, are replaced.
+    """
+    columns = db.execute_columnar("""
+    SELECT table_name, column_name
+    FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = ANY(%s)
+    ORDER BY table_name, ordinal_position
+    """, [list(TABLES)])
+    table_columns = {}
+    for table, column in zip(columns["table_name"], columns["column_name"]):
+        table_columns.setdefault(table, []).append(column)
+
+    conn = _connect()
+    summary = {}
+    try:
+        for table in TABLES:
+            names = table_columns.get(table)
+            if not names:
+                continue
+            incremental = "updated_at" in names and not full
+            state = conn.execute(
+                "SELECT watermark FROM _sync_state WHERE table_name = ?", (table,)
+            ).fetchone()
+            watermark = state[0] if incremental and state else None
+
+            query = f"SELECT {', '.join(names)} FROM {table}"
+            params = []
+            if watermark:
+                # Rows in the lag window are copied again; INSERT OR REPLACE on the
+                # primary key replaces them, so copying a row twice changes nothing
+                query += " WHERE updated_at >= %s"
+                params.append(watermark)
+            data = db.execute_columnar(query, params)
+            rows = list(zip(*(map(_local_value, data[n]) for n in names)))
+
+            if not watermark:
+                # Recreated on full copies so column changes upstream are picked up
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(names)}, PRIMARY KEY (id))")
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                rows,
+            )
+
+            new_watermark = watermark
+            if "updated_at" in names and data["updated_at"]:
+                latest = max(v for v in data["updated_at"] if v is not None)
+                lagged = _local_value(latest - timedelta(seconds=WATERMARK_LAG_SECONDS))
+                new_watermark = max(filter(None, [watermark, lagged]))
+            conn.execute("""
+            INSERT OR REPLACE INTO _sync_state (table_name, watermark, rows, synced_at)
+            VALUES (?, ?, (SELECT COUNT(*) FROM {0}), ?)
+            """.format(table), (table, new_watermark, time.time()))
+            conn.commit()
+            summary[table] = {"copied": len(rows), "incremental": bool(watermark)}
+    finally:
+        conn.close()
+    return summary
+
+
+def status():
+    """Return per-table row counts and sync times of the local snapshot"""
+    conn = _connect(read_only=True)
+    try:
+        return [
+            {"table": t, "watermark": w, "rows": r, "synced_at": datetime.fromtimestamp(s).isoformat(sep=" ")}
+            for t, w, r, s in conn.execute("SELECT * FROM _sync_state ORDER BY table_name")
+        ]
+    finally:
+        conn.close()
+
+
+# Authorizer actions an ad-hoc report may perform; ATTACH, PRAGMA and all writes are denied
+READ_ACTIONS = frozenset((
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, "SQLITE_RECURSIVE", 33),
+))
+
+
+def _authorize(action, *args):
+    return sqlite3.SQLITE_OK if action in READ_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def run_report(report=None, sql=None, params=None):
+    """Run a canned report or a read-only ad-hoc SELECT against the snapshot"""
+    if report:
+        if report not in REPORTS:
+            raise ValueError(f"Unknown report: {report}")
+        sql = REPORTS[report]
+    elif (sql.split(None, 1) or [""])[0].upper() not in ("SELECT", "WITH"):
+        raise ValueError("Only SELECT or WITH statements can be run against the snapshot")
+    conn = _connect(read_only=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA query_only = 1")
+        conn.set_authorizer(_authorize)
+        return [dict(r) for r in conn.execute(sql, params or {})]
+    except sqlite3.DatabaseError as e:
+        if report:
+            raise
+        raise ValueError(f"Query rejected: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    full = "--full" in sys.argv
+    for table, info in sync(full=full).items():
+        mode = "incremental" if info["incremental"] else "full"
+        print(f"{table}: {info['copied']} rows copied ({mode})")
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+
+import db
+
+# Weekly rest days as date.weekday() numbers (Monday=0 ... Sunday=6)
+WEEKLY_REST_DAYS = frozenset(
+    int(d) for d in os.getenv("WEEKLY_REST_DAYS", "5,6").split(",") if d.strip()
+)
+# How long the holidays snapshot is trusted before it is reloaded
+CALENDAR_TTL_SECONDS = float(os.getenv("CALENDAR_TTL_SECONDS", "3600"))
+
+_lock = threading.Lock()
+_holidays = None
+_loaded_at = 0.0
+# year -> (working-day flags, prefix sums); prefix[i] = working days before day i
+_years = {}
+
+
+def _to_date(value):
+    """Accept a date, datetime or YYYY-MM-DD string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _load_holidays():
+    """Load all holiday dates in one round trip"""
+    rows = db.execute_query("SELECT holiday_date FROM holidays")
+    return {_to_date(r["holiday_date"]) for r in rows or []}
+
+
+def _year(year):
+    """Return (flags, prefix) for a year, building it on first use"""
+    global _holidays, _loaded_at
+    with _lock:
+        if _holidays is None or time.monotonic() - _loaded_at > CALENDAR_TTL_SECONDS:
+            _holidays = _load_holidays()
+            _loaded_at = time.monotonic()
+            _years.clear()
+
+        cached = _years.get(year)
+        if cached is not None:
+            return cached
+
+        first = date(year, 1, 1)
+        days = (date(year + 1, 1, 1) - first).days
+        flags = bytearray(days)
+        prefix = array("H", [0]) * (days + 1)
+        for i in range(days):
+            day = first + timedelta(days=i)
+            flags[i] = day.weekday() not in WEEKLY_REST_DAYS and day not in _holidays
+            prefix[i + 1] = prefix[i] + flags[i]
+
+        _years[year] = (flags, prefix)
+        return flags, prefix
+
+
+def is_working_day(day):
+    """Return True if the date is neither a weekly rest day nor a holiday"""
+    day = _to_date(day)
+    flags, _ = _year(day.year)
+    return bool(flags[day.timetuple().tm_yday - 1])
+
+
+def working_days_between(start, end):
+    """
+    Count working days from start to end, both inclusive.
+
+    Each year touched costs a single prefix-sum lookup, so the answer does not
+    depend on the length of the range.
+    """
+    start = _to_date(start)
+    end = _to_date(end)
+    if end < start:
+        return 0
+
+    total = 0
+    for year in range(start.year, end.year + 1):
+        _, prefix = _year(year)
+        lo = start.timetuple().tm_yday - 1 if year == start.year else 0
+        hi = end.timetuple().tm_yday if year == end.year else len(prefix) - 1
+        total += prefix[hi] - prefix[lo]
+    return total
+
+
+def month_bounds(year, month):
+    """Return the first and last day of a month"""
+    first = date(year, month, 1)
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return first, last
+
+
+def working_days_in_month(year, month):
+    """Count working days in a calendar month"""
+    return working_days_between(*month_bounds(year, month))